@@ -0,0 +1,34 @@
+"""
+Moves vote timestamps from the bot_voters.timestamps arrays to bot_votes rows 
+and turns bot_voters into a vote count cache
+
+Apply with MIGRATION=data.snowfall.migrations.bot_votes
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Creating bot_votes")
+            await conn.execute(
+                """CREATE TABLE IF NOT EXISTS bot_votes (
+                    bot_id bigint not null,
+                    user_id bigint not null,
+                    ts timestamptz not null default NOW(),
+                    CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
+                )"""
+            )
+            await conn.execute("CREATE INDEX IF NOT EXISTS bot_votes_user_index ON bot_votes (user_id, bot_id, ts DESC)")
+
+            logger.info("Moving vote timestamps")
+            await conn.execute("ALTER TABLE bot_voters ADD COLUMN IF NOT EXISTS votes bigint not null default 0")
+            await conn.execute("ALTER TABLE bot_voters ADD COLUMN IF NOT EXISTS last_voted timestamptz")
+            await conn.execute(
+                """INSERT INTO bot_votes (bot_id, user_id, ts) 
+                SELECT bot_id, user_id, ts FROM bot_voters, unnest(timestamps) ts WHERE ts IS NOT NULL"""
+            )
+            await conn.execute(
+                """UPDATE bot_voters SET votes = COALESCE(cardinality(timestamps), 0), 
+                last_voted = (SELECT MAX(ts) FROM unnest(timestamps) ts)"""
+            )
+            await conn.execute("ALTER TABLE bot_voters DROP COLUMN timestamps")
+    return 0
@@ -0,0 +1,15 @@
+"""
+Adds an id to bot_votes rows, used with the timestamp as the vote timestamp cursor 
+(several votes may share a timestamp)
+
+Apply with MIGRATION=data.snowfall.migrations.bot_votes_id
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Adding bot_votes ids")
+            await conn.execute("ALTER TABLE bot_votes ADD COLUMN IF NOT EXISTS id bigserial")
+            await conn.execute("DROP INDEX IF EXISTS bot_votes_user_index")
+            await conn.execute("CREATE INDEX bot_votes_user_index ON bot_votes (user_id, bot_id, ts DESC, id DESC)")
+    return 0
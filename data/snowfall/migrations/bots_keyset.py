@@ -0,0 +1,15 @@
+"""
+Adds the index used by keyset pagination of bots (queue, denied and banned lists) 
+and makes bots.created_at non null so it can be used as a cursor
+
+Apply with MIGRATION=data.snowfall.migrations.bots_keyset
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Setting missing bot creation times")
+            await conn.execute("UPDATE bots SET created_at = to_timestamp(0) WHERE created_at IS NULL")
+            await conn.execute("ALTER TABLE bots ALTER COLUMN created_at SET NOT NULL")
+            await conn.execute("CREATE INDEX IF NOT EXISTS bots_state_created_index ON bots (state, created_at, bot_id)")
+    return 0
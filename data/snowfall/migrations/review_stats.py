@@ -0,0 +1,37 @@
+"""
+Creates bot_review_stats (review count, rating total and 1 to 10 star histogram of every bot) 
+and fills it from bot_reviews
+
+Apply with MIGRATION=data.snowfall.migrations.review_stats
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Creating bot_review_stats")
+            await conn.execute(
+                """CREATE TABLE IF NOT EXISTS bot_review_stats (
+                    bot_id bigint primary key,
+                    count bigint not null default 0,
+                    total float8 not null default 0,
+                    stars bigint[] not null default '{0,0,0,0,0,0,0,0,0,0}',
+                    CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
+                )"""
+            )
+
+            logger.info("Filling review stats")
+            await conn.execute(
+                """INSERT INTO bot_review_stats (bot_id, count, total, stars) 
+                SELECT bot_id, COUNT(1), SUM(star_rating), ARRAY(
+                    SELECT COUNT(r.id) FROM generate_series(1, 10) star 
+                    LEFT JOIN bot_reviews r ON r.bot_id = bot_reviews.bot_id AND r.reply = false 
+                    AND LEAST(GREATEST(CEIL(r.star_rating), 1), 10) = star 
+                    GROUP BY star ORDER BY star
+                ) FROM bot_reviews WHERE reply = false GROUP BY bot_id 
+                ON CONFLICT (bot_id) DO UPDATE SET count = excluded.count, total = excluded.total, stars = excluded.stars"""
+            )
+
+            # Review pages cache the aggregate
+            async for key in redis.scan_iter(match = "fl:reviewstats:*"):
+                await redis.delete(key)
+    return 0
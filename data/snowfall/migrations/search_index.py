@@ -0,0 +1,21 @@
+"""
+Adds the full text search vector and the trigram username index used by bot search
+
+Apply with MIGRATION=data.snowfall.migrations.search_index
+"""
+
+async def apply(*, postgres, redis, logger):
+    logger.info("Adding search vector to bots")
+    await postgres.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    await postgres.execute(
+        """ALTER TABLE bots ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(username_cached, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(long_description, '')), 'C')
+        ) STORED"""
+    )
+
+    logger.info("Creating search indexes")
+    await postgres.execute("CREATE INDEX IF NOT EXISTS bots_search_vector_index ON bots USING GIN (search_vector)")
+    await postgres.execute("CREATE INDEX IF NOT EXISTS bots_username_trgm_index ON bots USING GIN (username_cached gin_trgm_ops)")
+    return 0
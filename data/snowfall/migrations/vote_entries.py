@@ -0,0 +1,18 @@
+"""
+Creates vote_entries (ids of applied vote stream entries) so redelivered votes are not applied twice
+
+Apply with MIGRATION=data.snowfall.migrations.vote_entries
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Creating vote_entries")
+            await conn.execute(
+                """CREATE TABLE IF NOT EXISTS vote_entries (
+                    id text primary key,
+                    applied_at timestamptz not null default NOW()
+                )"""
+            )
+            await conn.execute("CREATE INDEX IF NOT EXISTS vote_entries_applied_index ON vote_entries (applied_at)")
+    return 0
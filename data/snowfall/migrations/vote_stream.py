@@ -0,0 +1,18 @@
+"""
+Merges duplicate bot_stats_votes_pm rows and adds the unique index the vote stream rollup upserts on
+
+Apply with MIGRATION=data.snowfall.migrations.vote_stream
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Merging duplicate monthly vote stats")
+            await conn.execute(
+                """CREATE TEMP TABLE bot_stats_votes_pm_dupes ON COMMIT DROP AS 
+                SELECT bot_id, month, SUM(votes) AS votes FROM bot_stats_votes_pm GROUP BY bot_id, month HAVING COUNT(*) > 1"""
+            )
+            await conn.execute("DELETE FROM bot_stats_votes_pm WHERE (bot_id, month) IN (SELECT bot_id, month FROM bot_stats_votes_pm_dupes)")
+            await conn.execute("INSERT INTO bot_stats_votes_pm (bot_id, month, votes) SELECT bot_id, month, votes FROM bot_stats_votes_pm_dupes")
+            await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS bot_stats_votes_pm_unique ON bot_stats_votes_pm (bot_id, month)")
+    return 0
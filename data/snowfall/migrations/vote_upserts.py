@@ -0,0 +1,29 @@
+"""
+Merges duplicate bot_voters and bot_stats_votes rows and adds the unique indexes vote_bot upserts on
+
+Apply with MIGRATION=data.snowfall.migrations.vote_upserts
+"""
+
+async def apply(*, postgres, redis, logger):
+    async with postgres.acquire() as conn:
+        async with conn.transaction():
+            logger.info("Merging duplicate voters")
+            await conn.execute(
+                """CREATE TEMP TABLE bot_voters_dupes ON COMMIT DROP AS 
+                SELECT bot_id, user_id, array_agg(ts ORDER BY ts) AS timestamps FROM bot_voters, unnest(timestamps) ts 
+                WHERE (bot_id, user_id) IN (SELECT bot_id, user_id FROM bot_voters GROUP BY bot_id, user_id HAVING COUNT(*) > 1) 
+                GROUP BY bot_id, user_id"""
+            )
+            await conn.execute("DELETE FROM bot_voters WHERE (bot_id, user_id) IN (SELECT bot_id, user_id FROM bot_voters_dupes)")
+            await conn.execute("INSERT INTO bot_voters (bot_id, user_id, timestamps) SELECT bot_id, user_id, timestamps FROM bot_voters_dupes")
+            await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS bot_voters_unique ON bot_voters (bot_id, user_id)")
+
+            logger.info("Merging duplicate vote stats")
+            await conn.execute(
+                """CREATE TEMP TABLE bot_stats_votes_dupes ON COMMIT DROP AS 
+                SELECT bot_id, MAX(total_votes) AS total_votes FROM bot_stats_votes GROUP BY bot_id HAVING COUNT(*) > 1"""
+            )
+            await conn.execute("DELETE FROM bot_stats_votes WHERE bot_id IN (SELECT bot_id FROM bot_stats_votes_dupes)")
+            await conn.execute("INSERT INTO bot_stats_votes (bot_id, total_votes) SELECT bot_id, total_votes FROM bot_stats_votes_dupes")
+            await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS bot_stats_votes_unique ON bot_stats_votes (bot_id)")
+    return 0
@@ -0,0 +1,24 @@
+"""
+Moves websocket events from the ws field of the {type}-{id} hashes to the {type}-{id}-ws streams
+
+Apply with MIGRATION=data.snowfall.migrations.ws_events_stream
+"""
+import orjson
+
+
+async def apply(*, postgres, redis, logger):
+    moved = 0
+    for type in ("bot", "server"):
+        async for key in redis.scan_iter(match = f"{type}-*", _type = "hash"):
+            events = await redis.hget(key, "ws")
+            if not events:
+                continue
+            events = sorted(orjson.loads(events).items(), key = lambda event: event[1].get("m", {}).get("ts", 0))
+            async with redis.pipeline(transaction = False) as pipe:
+                for id, event in events:
+                    pipe.xadd(key.decode("utf-8") + "-ws", {"ws": orjson.dumps({id: event})})
+                pipe.hdel(key, "ws")
+                await pipe.execute()
+            moved += 1
+    logger.info(f"Moved websocket events of {moved} targets")
+    return 0
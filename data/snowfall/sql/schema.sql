@@ -1,6 +1,7 @@
 CREATE DATABASE fateslist;
 \c fateslist
 CREATE EXTENSION "uuid-ossp";
+CREATE EXTENSION pg_trgm;
 
 CREATE TABLE bots (
     id BIGINT NOT NULL, -- Used by piccolo, must be equal to bot_id
@@ -31,7 +32,7 @@ CREATE TABLE bots (
     banner_card text,
     banner_page text,
     keep_banner_decor boolean default true,
-    created_at timestamptz DEFAULT NOW(),
+    created_at timestamptz not null DEFAULT NOW(),
     invite text,
     invite_amount integer DEFAULT 0,
     github TEXT,
@@ -39,9 +40,18 @@ CREATE TABLE bots (
     privacy_policy text,
     nsfw boolean DEFAULT false,
     verifier bigint,
-    js_allowed BOOLEAN DEFAULT TRUE
+    js_allowed BOOLEAN DEFAULT TRUE,
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(username_cached, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(long_description, '')), 'C')
+    ) STORED
 );
 
+CREATE INDEX bots_search_vector_index ON bots USING GIN (search_vector);
+CREATE INDEX bots_username_trgm_index ON bots USING GIN (username_cached gin_trgm_ops);
+CREATE INDEX bots_state_created_index ON bots (state, created_at, bot_id); -- Keyset pagination
+
 CREATE TABLE bot_resources (
     id uuid primary key DEFAULT uuid_generate_v4(),
     bot_id BIGINT NOT NULL,
@@ -110,12 +120,16 @@ CREATE TABLE bot_stats_votes (
    CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+CREATE UNIQUE INDEX bot_stats_votes_unique ON bot_stats_votes (bot_id);
+
 CREATE TABLE bot_stats_votes_pm (
    bot_id bigint,
    month integer,
    votes bigint
 );
 
+CREATE UNIQUE INDEX bot_stats_votes_pm_unique ON bot_stats_votes_pm (bot_id, month);
+
 CREATE TABLE bot_reviews (
    id uuid primary key DEFAULT uuid_generate_v4(),
    bot_id bigint not null,
@@ -132,13 +146,44 @@ CREATE TABLE bot_reviews (
    CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+-- Root review aggregate of a bot, stars is the 1 to 10 star histogram (ratings are rounded up)
+CREATE TABLE bot_review_stats (
+   bot_id bigint primary key,
+   count bigint not null default 0,
+   total float8 not null default 0,
+   stars bigint[] not null default '{0,0,0,0,0,0,0,0,0,0}',
+   CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- Vote count cache of bot_votes
 CREATE TABLE bot_voters (
     bot_id bigint,
     user_id bigint,
-    timestamps timestamptz[] DEFAULT '{NOW()}',
+    votes bigint not null default 0,
+    last_voted timestamptz,
+    CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE UNIQUE INDEX bot_voters_unique ON bot_voters (bot_id, user_id);
+
+CREATE TABLE bot_votes (
+    id bigserial,
+    bot_id bigint not null,
+    user_id bigint not null,
+    ts timestamptz not null default NOW(),
     CONSTRAINT bots_fk FOREIGN KEY (bot_id) REFERENCES bots(bot_id) ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+CREATE INDEX bot_votes_user_index ON bot_votes (user_id, bot_id, ts DESC, id DESC);
+
+-- Applied vote stream entries, so redelivered votes are not applied twice
+CREATE TABLE vote_entries (
+    id text primary key,
+    applied_at timestamptz not null default NOW()
+);
+
+CREATE INDEX vote_entries_applied_index ON vote_entries (applied_at);
+
 CREATE TABLE users (
     id bigint not null, -- Used by piccolo, must be equal to user_id
     user_id bigint not null unique,
@@ -11,5 +11,6 @@ from .permissions import *  # Import permission functions
 from .ratelimits import *  # Import ratelimit handler
 from .renderers import *  # Import the renderers for bot, index etc.
 from .reviews import *  # Import review parser
+from .streaming import *  # Import NDJSON streaming responses
 from .system import *  # System module
 from .templating import *  # Import the HTML templating system
@@ -438,6 +438,15 @@ def db_wipeuser():
     async def _wipeuser():
         logger.info("Wiping user info in db")
         db = await asyncpg.create_pool()
+
+        # Reviews are deleted with the user, remove them from the review aggregates (see review_stats_update)
+        reviews = await db.fetch("SELECT bot_id, star_rating FROM bot_reviews WHERE user_id = $1 AND reply = false", user_id)
+        await db.executemany(
+            """UPDATE bot_review_stats SET count = count - 1, total = total - $2::float8, 
+            stars[LEAST(GREATEST(CEIL($2::float8), 1), 10)::int] = stars[LEAST(GREATEST(CEIL($2::float8), 1), 10)::int] - 1 
+            WHERE bot_id = $1""",
+            [(review["bot_id"], review["star_rating"]) for review in reviews]
+        )
         await db.execute("DELETE FROM users WHERE user_id = $1", user_id)
         await db.execute("INSERT INTO users (user_id, vote_epoch) VALUES ($1, NOW())", user_id) # INSERT minimal data to prevent abuse
         
@@ -450,16 +459,25 @@ def db_wipeuser():
         for bot in bots:
             await db.execute("DELETE FROM bots WHERE bot_id = $1", bot["bot_id"])
             
-        votes = await db.fetch("SELECT bot_id from bot_voters WHERE user_id = $1", user_id)
-        for vote in votes:
-            await db.execute("UPDATE bots SET votes = votes - 1 WHERE bot_id = $1", vote["bot_id"])
+        await db.execute(
+            "UPDATE bots SET votes = bots.votes - bot_voters.votes FROM bot_voters WHERE bot_voters.user_id = $1 AND bots.bot_id = bot_voters.bot_id", 
+            user_id
+        )
             
         await db.execute("DELETE FROM bot_voters WHERE user_id = $1", user_id)
+        await db.execute("DELETE FROM bot_votes WHERE user_id = $1", user_id)
            
         logger.info("Clearing redis info on user...")
         redis = aioredis.from_url('redis://localhost:1001', db=1)
         await redis.hdel(str(user_id), 'cache')
         await redis.hdel(str(user_id), 'ws')
+        await redis.delete(f"user-{user_id}-ws")
+        for review in reviews:
+            await redis.incr(f"fl:reviewver:{review['bot_id']}") # Drops review cache builds in progress
+            await redis.delete(f"fl:reviews:{review['bot_id']}", f"fl:reviewidx:{review['bot_id']}", f"fl:reviewstats:{review['bot_id']}")
+        await redis.publish("_worker_fates", f"CACHEINV 0 {user_id}")
+        await redis.publish("_worker_fates", f"TOKENINV 0 user {user_id}")
+        await redis.publish("_worker_fates", f"USERCTXINV 0 {user_id}")
         
         await redis.close()
         logger.success("Done wiping user")
@@ -188,6 +188,7 @@ class BotActions():
                 await connection.executemany("INSERT INTO bot_tags (bot_id, tag) VALUES ($1, $2)", tags_add) # Add all the tags to the database
 
         await bot_add_event(self.bot_id, enums.APIEvents.bot_add, {}) # Send a add_bot event to be succint and complete 
+        await profile_search_index(self.db, redis_db, [self.user_id] + extra_owners_fixed)
         owner = int(self.user_id)            
         bot_name = (await get_bot(self.bot_id))["username"]
 
@@ -216,6 +217,7 @@ class BotActions():
                     self.bot_id, self.library, self.webhook, self.description, self.long_description, self.prefix, self.website, self.support, self.banner_card, self.invite, self.github, self.features, self.long_description_type, self.webhook_type, self.css, self.donate, self.privacy_policy, self.nsfw, self.webhook_secret, self.banner_page, self.keep_banner_decor  # pyline: disable=line-too-long
                 ) # Update bot with new info
 
+                old_owners = await connection.fetch("SELECT owner FROM bot_owner WHERE bot_id = $1", self.bot_id)
                 await connection.execute("DELETE FROM bot_owner WHERE bot_id = $1 AND main = false", self.bot_id) # Delete all extra owners
                 done = []
                 for owner in self.extra_owners:
@@ -223,6 +225,7 @@ class BotActions():
                         continue
                     await connection.execute("INSERT INTO bot_owner (bot_id, owner, main) VALUES ($1, $2, $3)", self.bot_id, owner, False)
                     done.append(owner)
+                done_owners = done
 
                 await connection.execute("DELETE FROM bot_tags WHERE bot_id = $1", self.bot_id) # Delete all bot tags
                 done = []
@@ -238,7 +241,10 @@ class BotActions():
                         await connection.execute("INSERT INTO vanity (type, vanity_url, redirect) VALUES ($1, $2, $3)", 1, self.vanity, self.bot_id)
                 else:
                     await connection.execute("UPDATE vanity SET vanity_url = $1 WHERE redirect = $2", self.vanity, self.bot_id) # Update the vanity since bot already use it
+        await cache_long_description(redis_db, self.bot_id, self.long_description, self.long_description_type)
+        await bot_page_invalidate(redis_db, self.bot_id)
         await bot_add_event(self.bot_id, enums.APIEvents.bot_edit, {"user": str(self.user_id)}) # Send event
+        await profile_search_index(self.db, redis_db, list({owner["owner"] for owner in old_owners} | set(done_owners)))
         edit_embed = discord.Embed(
             title="Bot Edit!", 
             description=f"<@{self.user_id}> has edited the bot <@{self.bot_id}>!", 
@@ -1,3 +1,7 @@
+import hashlib
+import os
+from collections import OrderedDict
+
 from fastapi import Security
 from fastapi.security.api_key import (APIKey, APIKeyCookie, APIKeyHeader,
                                       APIKeyQuery)
@@ -8,8 +12,78 @@ bot_auth_header = APIKeyHeader(name="Authorization", description="These endpoint
 
 user_auth_header = APIKeyHeader(name="Authorization", description="These endpoints require a user token. You can get this from your profile under the User Token section. If you are using this for voting, make sure to allow users to opt out!\n\nA prefix of `User` before the user token such as `User abcdef` is supported and can be used to avoid ambiguity but is not required outside of endpoints that have both a user and a bot authentication option such as Get Votes. In such endpoints, the default will always be a bot auth unless you prefix the token with `User`", scheme_name="User")
 
+class TokenCache():
+    """
+    Per-worker cache of api token (hashed) -> principal (kind, id, state) with a short TTL. 
+    Unknown tokens are cached as None too
+    """
+    def __init__(self, maxsize: int = 10000, ttl: int = 30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict() # Token hash -> (time added, principal)
+        self._principals = {} # (kind, id) -> token hash
+
+    def get(self, token_hash: str) -> tuple:
+        """Returns (hit, principal)"""
+        entry = self._entries.get(token_hash)
+        if entry is None:
+            return False, None
+        if time.time() - entry[0] > self.ttl:
+            self._drop(token_hash)
+            return False, None
+        self._entries.move_to_end(token_hash)
+        return True, entry[1]
+
+    def set(self, token_hash: str, principal: Optional[tuple]):
+        self._entries[token_hash] = (time.time(), principal)
+        self._entries.move_to_end(token_hash)
+        if principal:
+            self._principals[principal[:2]] = token_hash
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, kind: str, id: int):
+        token_hash = self._principals.get((kind, id))
+        if token_hash:
+            self._drop(token_hash)
+
+    def _drop(self, token_hash: str):
+        _, principal = self._entries.pop(token_hash)
+        if principal and self._principals.get(principal[:2]) == token_hash:
+            del self._principals[principal[:2]]
+
+token_cache = TokenCache()
+
+
+async def token_cache_invalidate(redis, kind: str, id: int):
+    """Drops the cached token of a bot or user on all workers (TOKENINV <PID> <KIND> <ID>)"""
+    token_cache.invalidate(kind, int(id))
+    await redis.publish("_worker_fates", f"TOKENINV {os.getpid()} {kind} {id}")
+
+
+async def resolve_token(api_token: str) -> Optional[tuple]:
+    """Resolves an api token to (kind, id, state) where kind is bot or user (state is None for users)"""
+    api_token = str(api_token)
+    token_hash = hashlib.sha256(api_token.encode("utf-8")).hexdigest()
+    hit, principal = token_cache.get(token_hash)
+    if hit:
+        return principal
+
+    row = await db.fetchrow(
+        """SELECT 'bot' AS kind, bot_id AS id, state FROM bots WHERE api_token = $1 
+        UNION ALL SELECT 'user', user_id, NULL FROM users WHERE api_token = $1 LIMIT 1""", 
+        api_token
+    )
+    principal = (row["kind"], row["id"], row["state"]) if row else None
+    token_cache.set(token_hash, principal)
+    return principal
+
+
 async def _bot_auth(bot_id: int, api_token: str):
-    return await db.fetchval("SELECT bot_id FROM bots WHERE bot_id = $1 AND api_token = $2", bot_id, str(api_token))
+    principal = await resolve_token(api_token)
+    if principal and principal[0] == "bot" and principal[1] == bot_id:
+        return bot_id
+    return None
 
 async def _user_auth(user_id: int, api_token: str):
     if isinstance(user_id, int):
@@ -18,7 +92,10 @@ async def _user_auth(user_id: int, api_token: str):
         user_id = int(user_id)
     else:
         return None
-    return await db.fetchval("SELECT user_id FROM users WHERE user_id = $1 AND api_token = $2", user_id, str(api_token))
+    principal = await resolve_token(api_token)
+    if principal and principal[0] == "user" and principal[1] == user_id:
+        return user_id
+    return None
 
 async def bot_auth_check(bot_id: int, bot_auth: str = Security(bot_auth_header)):
     if bot_auth.startswith("Bot "):
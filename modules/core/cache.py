@@ -1,3 +1,6 @@
+import os
+from collections import OrderedDict
+
 from aioredis import Connection
 
 from config._logger import logger
@@ -5,103 +8,264 @@ from config._logger import logger
 from .imports import *
 from .system import redis_ipc_new
 
+CACHE_VER = 17 # Current cache ver
+USER_FETCH_CONCURRENCY = 16 # Max concurrent GETCH calls to dragon per worker
+
+
+class UserL1Cache():
+    """
+    Per-worker LRU with a TTL in front of the redis user cache. 
+    Entries are the same dicts stored in redis so the usual expiry rules still apply on top of the TTL
+    """
+    def __init__(self, maxsize: int = 5000, ttl: int = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict() # User id -> (time added, cache)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.time() - entry[0] > self.ttl or not _user_cache_valid(entry[1]):
+            del self._entries[user_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user_id: str, cache: dict):
+        self._entries[user_id] = (time.time(), cache)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last = False)
+            self.evictions += 1
+
+    def invalidate(self, *user_ids: str):
+        for user_id in user_ids:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+user_l1 = UserL1Cache()
+
+
+async def user_cache_invalidate(redis, *user_ids):
+    """Invalidates the L1 user cache entries of the given users on all workers (CACHEINV <PID> <USER ID>...)"""
+    user_ids = [str(user_id) for user_id in user_ids]
+    if not user_ids:
+        return
+    user_l1.invalidate(*user_ids)
+    await redis.publish("_worker_fates", f"CACHEINV {os.getpid()} {' '.join(user_ids)}")
+
+
+def _user_cache_valid(cache: dict) -> bool:
+    """Checks a cache entry against the cache version and the valid/invalid expiry rules"""
+    cache_time = time.time() - cache['epoch']
+    if cache["fl_cache_ver"] != CACHE_VER or (not cache["valid_user"] and cache_time > 60*20) or cache_time > 60*60*11:
+        return False
+    return True
+
+
+def _user_cache_filter(cache: dict, user_id: str, user_type: int, user_only: bool = False):
+    """Returns the user if the cache entry fits the requested user type, otherwise None"""
+    fetch = False
+    # Valid user and bot where bot is requested or all users requested
+    if cache.get("valid_user") and ((user_type == 2 and cache["bot"]) or user_type == 3):
+        fetch = True
+
+    # Valid users and user where user is requested or all users requested
+    elif cache.get("valid_user") and user_type == 1 and not cache["bot"]:
+        fetch = True
+
+    if fetch: # We got a match
+        if user_only:
+            return user_id, cache["username"]
+        return cache | {
+            "id": user_id,
+        }
+    return None # We got a user, but not fitting in constraints
+
+
+_user_fetch_limit = asyncio.Semaphore(USER_FETCH_CONCURRENCY)
+
+
+async def _user_fetch_api(redis, user_id: str) -> Optional[dict]:
+    """Fetches a user from dragon (GETCH) and returns a new cache entry for it or None if dragon could not answer"""
+    logger.debug(f"Making API call to get user {user_id}")
+    async with _user_fetch_limit:
+        data = await redis_ipc_new(redis, "GETCH", args=[str(user_id)])
+    if data is None or data == b'-2':
+        return None
+
+    cache = {"fl_cache_ver": CACHE_VER, "epoch": time.time(), "valid_user": data != b'-1'}
+    if cache["valid_user"]:
+        cache |= orjson.loads(data)
+    return cache
+
+
+async def _user_cache_store(redis, db, caches: dict):
+    """Writes new cache entries back to redis in one pipeline and updates the cached bot usernames in postgres"""
+    if not caches:
+        return
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id, cache in caches.items():
+            pipe.hset(str(user_id), key = "cache", value = orjson.dumps(cache))
+        await pipe.execute()
+
+    # Other workers may have the old entries in their L1 cache
+    await user_cache_invalidate(redis, *caches.keys())
+    for user_id, cache in caches.items():
+        user_l1.set(str(user_id), cache)
+
+    # Update cached username in postgres for all valid bots
+    usernames = [(int(user_id), cache["username"]) for user_id, cache in caches.items() if cache["valid_user"] and cache["bot"]]
+    if usernames:
+        try:
+            await db.executemany("UPDATE bots SET username_cached = $2 WHERE bot_id = $1", usernames)
+        except Exception:
+            pass # Sometimes this cannot be done
+
+
+_user_fetches = {} # User id -> future of the in flight dragon fetch for it
+
+
+async def _user_fetch_api_many(redis, db, user_ids: List[str]) -> dict:
+    """
+    Fetches users from dragon and stores them in the cache. Concurrent misses for the same id 
+    share one in flight fetch so only one GETCH and one username update is done per id
+    """
+    loop = asyncio.get_running_loop()
+    owned, waiting = [], {}
+    for user_id in user_ids:
+        if user_id in _user_fetches:
+            waiting[user_id] = _user_fetches[user_id]
+        else:
+            _user_fetches[user_id] = loop.create_future()
+            owned.append(user_id)
+
+    caches = {}
+    try:
+        fetched = await asyncio.gather(*[_user_fetch_api(redis, user_id) for user_id in owned])
+        caches = dict(zip(owned, fetched))
+
+        # Add/Update redis
+        await _user_cache_store(redis, db, {user_id: cache for user_id, cache in caches.items() if cache is not None})
+    finally:
+        # Waiters get None if this fetch failed
+        for user_id in owned:
+            _user_fetches.pop(user_id).set_result(caches.get(user_id))
+
+    for user_id, fut in waiting.items():
+        caches[user_id] = await asyncio.shield(fut)
+    return caches
+
+
+def _user_ids_check(user_ids: List[str]) -> List[str]:
+    """Returns the user ids which can actually exist on discord"""
+    checked = []
+    for user_id in user_ids:
+        if len(user_id) not in [17, 18, 19, 20]: # Snowflake can be 17 - 20
+            logger.debug(f"Ignoring blatantly wrong User ID: {user_id}")
+            continue # This is impossible to actually exist on the discord API or on our cache
+        checked.append(user_id)
+    return checked
+
+
+def _worker_dbs(worker_session):
+    """Returns the postgres and redis to use for a fetch"""
+    if not worker_session:
+        logger.debug("Using builtins is deprecated. Use worker session instead")
+        return db, redis_db
+    return worker_session.postgres, worker_session.redis
+
 
 async def _user_fetch(
     user_id: str,
     user_type: int,
     user_only: bool = False,
-    *, 
+    *,
     worker_session = None
 ) -> Optional[dict]:
     """Internal function to fetch a user. If worker_sessiom is not explicitly specified, a warning will be logged"""
-    if not worker_session:
-        logger.debug("Using builtins is deprecated. Use worker session instead")
-        redis = redis_db
-    else:
-        db = worker_session.postgres
-        redis = worker_session.redis
-    
+    return (await _user_fetch_many([user_id], user_type, user_only = user_only, worker_session = worker_session))[0]
+
+
+async def _user_fetch_many(
+    user_ids: List[str],
+    user_type: int,
+    user_only: bool = False,
+    *,
+    worker_session = None
+) -> List[Optional[dict]]:
+    """
+    Internal function to fetch many users at once. The redis cache is read in one pipeline,
+    only the misses are fetched from dragon (concurrently) and the results are written back
+    in one pipeline. Results are returned in the same order as user_ids
+    """
+    db, redis = _worker_dbs(worker_session)
+
     # Check if a suitable version is in the cache first before querying Discord
+    check_ids = []
+    users = {}
 
-    CACHE_VER = 17 # Current cache ver
+    # Check the in-process cache before redis
+    for user_id in dict.fromkeys(_user_ids_check(user_ids)): # Dedupe, keep order
+        cache = user_l1.get(user_id)
+        if cache:
+            users[user_id] = _user_cache_filter(cache, user_id, user_type, user_only)
+        else:
+            check_ids.append(user_id)
 
-    if len(user_id) not in [17, 18, 19, 20]: # Snowflake can be 17 - 20
-        logger.debug(f"Ignoring blatantly wrong User ID: {user_id}")
-        return None # This is impossible to actually exist on the discord API or on our cache
+    if check_ids:
+        # Query redis cache for some important info
+        async with redis.pipeline(transaction=False) as pipe:
+            for user_id in check_ids:
+                pipe.hget(user_id, key = "cache")
+            caches = await pipe.execute()
+    else:
+        caches = []
 
-    # Query redis cache for some important info
-    cache = await redis.hget(user_id, key = "cache") # This is bot in cache
-    if cache: # We got a match
-        cache = orjson.loads(cache)
-        cache_time = time.time() - cache['epoch']
-        if cache["fl_cache_ver"] != CACHE_VER or (not cache["valid_user"] and time.time() - cache_time > 60*20) or cache_time > 60*60*11:
+    misses = []
+    for user_id, cache in zip(check_ids, caches):
+        if cache: # We got a match
+            cache = orjson.loads(cache)
+            if _user_cache_valid(cache):
+                logger.debug(f"Using cache for id {user_id}") # Use cache
+                user_l1.set(user_id, cache)
+                users[user_id] = _user_cache_filter(cache, user_id, user_type, user_only)
+                continue
             # Check for cache expiry
             logger.debug(f"Not using cache for id {user_id}")
-        else:
-            logger.debug(f"Using cache for id {user_id}") # Use cache
-            fetch = False
-            # Valid user and bot where bot is requested or all users requested
-            if cache.get("valid_user") and ((user_type == 2 and cache["bot"]) or user_type == 3):
-                fetch = True
-                
-            # Valid users and user where user is requested or all users requested
-            elif cache.get("valid_user") and user_type == 1 and not cache["bot"]: 
-                fetch = True
-                
-            if fetch: # We got a match
-                if user_only:
-                    return user_id, cache["username"]
-                return cache | {
-                    "id": user_id, 
-                }
-            return None # We got a bot, but not fitting in constraints
+        misses.append(user_id)
 
-    logger.debug(f"Making API call to get user {user_id}")
-    cmd_id = uuid.uuid4()
-    data = await redis_ipc_new(redis, "GETCH", args=[str(user_id)])
-    if data is None or data == b'-2':
-        return None
+    if misses:
+        fetched = await _user_fetch_api_many(redis, db, misses)
+        for user_id in misses:
+            cache = fetched.get(user_id)
+            users[user_id] = _user_cache_filter(cache, user_id, user_type, user_only) if cache else None
 
-    elif data == b'-1':
-        valid = False
-    
-    else:
-        data = orjson.loads(data)
-        valid = True
-
-    cache = {"fl_cache_ver": CACHE_VER, "epoch": time.time(), "valid_user": valid}
-
-    if valid:
-        if data["bot"]: # Update cached username in postgres if valid username in asyncio background task
-            try:
-                await db.execute("UPDATE bots SET username_cached = $2 WHERE bot_id = $1", int(user_id), data["username"])
-            except Exception:
-                pass # Sometimes this cannot be done
-
-        # Create cache and add to redis hash
-        cache |= data
-       
-    # Add/Update redis
-    await redis_db.hset(
-        str(user_id),
-        key = "cache",
-        value = orjson.dumps(cache)
-    ) 
-    if not valid:
-        return None
+    return [users.get(user_id) for user_id in user_ids]
 
-    fetch = False
-    if (user_type == 2 and data["bot"]) or user_type == 3: # Same as when cached, see that for this
-        fetch = True
-    elif user_type == 1 and not data["bot"]:
-        fetch = True
-    if fetch:
-        if user_only:
-            return user_id, data["username"]
-        return data | {
-            "id": user_id
-        } 
-    return None
 
 async def get_user(user_id: int, user_only = False, *, worker_session = None) -> Optional[dict]:
     return await _user_fetch(str(int(user_id)), 1, user_only = user_only, worker_session = worker_session) # 1 means user
@@ -111,3 +275,12 @@ async def get_bot(user_id: int, user_only = False, *, worker_session = None) ->
 
 async def get_any(user_id: int, user_only = False, *, worker_session = None) -> Optional[dict]:
     return await _user_fetch(str(int(user_id)), 3, user_only = user_only, worker_session = worker_session) # 3 means all
+
+async def get_users_many(user_ids: List[int], user_only = False, *, worker_session = None) -> List[Optional[dict]]:
+    return await _user_fetch_many([str(int(user_id)) for user_id in user_ids], 1, user_only = user_only, worker_session = worker_session) # 1 means user
+
+async def get_bots_many(user_ids: List[int], user_only = False, *, worker_session = None) -> List[Optional[dict]]:
+    return await _user_fetch_many([str(int(user_id)) for user_id in user_ids], 2, user_only = user_only, worker_session = worker_session) # 2 means bot
+
+async def get_any_many(user_ids: List[int], user_only = False, *, worker_session = None) -> List[Optional[dict]]:
+    return await _user_fetch_many([str(int(user_id)) for user_id in user_ids], 3, user_only = user_only, worker_session = worker_session) # 3 means all
@@ -1,6 +1,8 @@
 from .base import DiscordUser
 from typing import Optional, List
 from modules.core.cache import get_bot
+from modules.core.events import event_buffer
+import modules.models.enums as enums
 
 class Bot(DiscordUser):
     async def fetch(self):
@@ -19,6 +21,5 @@ class Bot(DiscordUser):
     
     async def invite(self, user_id: Optional[int] = None):
         """Invites a user to a bot updating invite amount"""
-        await self.db.execute("UPDATE bots SET invite_amount = invite_amount + 1 WHERE bot_id = $2", self.id)
-        await add_ws_event(self.id, {"m": {"e": enums.APIEvents.bot_invite}, "ctx": {"user": str(user_id)}})
+        event_buffer.add(self.id, {"m": {"e": enums.APIEvents.bot_invite}, "ctx": {"user": str(user_id)}}, invite = True)
         return await self.invite_url()
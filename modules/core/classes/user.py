@@ -1,7 +1,7 @@
 from .base import DiscordUser
 from .bot import Bot
 from .badge import Badge
-from modules.core.cache import get_user
+from modules.core.cache import get_user, get_bots_many
 from modules.core.helpers import redis_ipc_new
 from modules.models import enums   
 from config import main_server
@@ -12,8 +12,8 @@ class User(DiscordUser):
         """Fetch a user object from our cache"""
         return await get_user(self.id)
 
-    async def profile(self):
-        """Gets a users profile"""
+    async def profile(self, *, worker_session = None):
+        """Gets a users profile. Pass the worker session to resolve the users bots through it"""
         user = await self.db.fetchrow(
             "SELECT badges, state, description, css, js_allowed FROM users WHERE user_id = $1", 
             self.id
@@ -38,9 +38,10 @@ class User(DiscordUser):
         )
         
         bots = []
-        for bot in _bots:
+        bot_users = await get_bots_many([bot["bot_id"] for bot in _bots], worker_session = worker_session)
+        for bot, bot_user in zip(_bots, bot_users):
             bot_obj = Bot(id = bot["bot_id"], db = self.db)
-            bots.append(dict(bot) | {"invite": await bot_obj.invite_url(), "user": await bot_obj.fetch()})
+            bots.append(dict(bot) | {"invite": await bot_obj.invite_url(), "user": bot_user})
         
         approved_bots = [obj for obj in bots if obj["state"] in (enums.BotState.approved, enums.BotState.certified)]
         certified_bots = [obj for obj in bots if obj["state"] == enums.BotState.certified]
@@ -2,15 +2,22 @@
 Handle API Events, webhooks and websockets
 """
 
+import re
+from collections import Counter
+
+from config._logger import logger
+
 from .cache import get_bot, get_user
 from .imports import *
 from .ipc import redis_ipc_new
 
+WS_EVENTS_MAXLEN = 5000 # Approximate amount of events kept per target
+EVENT_FLUSH_INTERVAL = 5 # Seconds between flushes of the view/invite buffer
+EVENT_BUFFER_MAX_EVENTS = 10000 # Events buffered per worker between flushes
 
-async def add_ws_event(target: int, ws_event: dict, *, id: Optional[uuid.UUID] = None, type: str = "bot") -> None:
-    """A WS Event must have the following format:
-        - {e: Event Name, t: Event Type (Optional), ctx: Context, m: Event Metadata}
-    """
+
+def _ws_event_payload(ws_event: dict, id: Optional[uuid.UUID] = None) -> bytes:
+    """Adds the event id and timestamp to a ws event and returns it as {eid: event}"""
     if not id:
         id = uuid.uuid4()
     id = str(id)
@@ -18,14 +25,114 @@ async def add_ws_event(target: int, ws_event: dict, *, id: Optional[uuid.UUID] =
         ws_event["m"] = {}
     ws_event["m"]["eid"] = id
     ws_event["m"]["ts"] = time.time()
-    curr_ws_events = await redis_db.hget(f"{type}-{target}", key = "ws") # Get all the websocket events from the ws key
-    if curr_ws_events is None:
-        curr_ws_events = {} # No ws events means empty dict
-    else:
-        curr_ws_events = orjson.loads(curr_ws_events) # Otherwise, orjson load the current events
-    curr_ws_events[id] = ws_event # Add event to current ws events
-    await redis_db.hset(f"{type}-{target}", key = "ws", value = orjson.dumps(curr_ws_events)) # Add it to redis
-    await redis_db.publish(f"{type}-{target}", orjson.dumps({id: ws_event})) # Publish it to consumers
+    return orjson.dumps({id: ws_event})
+
+def _ws_event_queue(pipe, target: int, payload: bytes, type: str = "bot"):
+    pipe.xadd(f"{type}-{target}-ws", {"ws": payload}, maxlen = WS_EVENTS_MAXLEN, approximate = True) # Append to event log
+    pipe.publish(f"{type}-{target}", payload) # Publish it to consumers
+
+async def add_ws_event(target: int, ws_event: dict, *, id: Optional[uuid.UUID] = None, type: str = "bot") -> None:
+    """A WS Event must have the following format:
+        - {e: Event Name, t: Event Type (Optional), ctx: Context, m: Event Metadata}
+
+    Events are appended to the {type}-{target}-ws stream (as {eid: event} in the ws field) and published on {type}-{target}
+    """
+    payload = _ws_event_payload(ws_event, id)
+    async with redis_db.pipeline(transaction=False) as pipe:
+        _ws_event_queue(pipe, target, payload, type = type)
+        await pipe.execute()
+
+
+class EventBuffer():
+    """
+    Per-worker buffer for high volume view and invite events. Events are sent to subscribers 
+    and invites are added to bots.invite_amount every EVENT_FLUSH_INTERVAL seconds, 
+    as one redis pipeline and one postgres update
+    """
+    def __init__(self):
+        self.invites = Counter() # Bot id -> invites
+        self.events = [] # (type, target, payload) of events to emit to subscribers
+        self.dropped = 0 # Events dropped because the buffer was full
+        self._task = None
+
+    def add(self, target: int, ws_event: dict, *, type: str = "bot", invite: bool = False, emit: bool = True):
+        """
+        Buffers a event (and invite if set) of a target. The ws event is sent to subscribers unless emit is unset 
+        (at most EVENT_BUFFER_MAX_EVENTS are buffered between flushes)
+        """
+        target = int(target)
+        if invite:
+            self.invites[target] += 1
+        if emit:
+            if len(self.events) < EVENT_BUFFER_MAX_EVENTS:
+                self.events.append((type, target, _ws_event_payload(ws_event)))
+            else:
+                self.dropped += 1
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._task and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._task = loop.create_task(self._flusher())
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(EVENT_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def flush(self):
+        """Writes out all buffered events"""
+        invites, events = self.invites, self.events
+        self.invites, self.events = Counter(), []
+        if self.dropped:
+            logger.warning(f"Event buffer was full, dropped {self.dropped} events")
+            self.dropped = 0
+
+        if events:
+            try:
+                async with redis_db.pipeline(transaction=False) as pipe:
+                    for type, target, payload in events:
+                        _ws_event_queue(pipe, target, payload, type = type)
+                    await pipe.execute()
+            except Exception as exc:
+                logger.warning(f"Could not send buffered events: {exc}")
+
+        if invites:
+            try:
+                await db.execute(
+                    """UPDATE bots SET invite_amount = bots.invite_amount + v.amount 
+                    FROM unnest($1::bigint[], $2::int[]) AS v(bot_id, amount) WHERE bots.bot_id = v.bot_id""",
+                    list(invites.keys()),
+                    list(invites.values())
+                )
+            except Exception as exc:
+                # Keep the invites for the next flush
+                logger.warning(f"Could not flush invites: {exc}")
+                self.invites.update(invites)
+
+event_buffer = EventBuffer()
+
+
+ws_event_id_re = re.compile(r"^\d+(-\d+)?$") # Redis stream ids
+
+async def get_ws_events(target: int, *, type: str = "bot", after: Optional[str] = None, before: Optional[str] = None, limit: int = 100) -> dict:
+    """
+    Gets websocket events of a target in order. after and before are stream ids (cursors, exclusive). 
+    The returned cursor can be passed as after to get the next page. None is returned if a cursor is invalid
+    """
+    if any(cursor and not ws_event_id_re.fullmatch(cursor) for cursor in (after, before)):
+        return None
+    entries = await redis_db.xrange(
+        f"{type}-{target}-ws", 
+        min = f"({after}" if after else "-", 
+        max = f"({before}" if before else "+", 
+        count = limit
+    )
+    events = {}
+    for _, fields in entries:
+        events |= orjson.loads(fields[b"ws"])
+    return {"events": events, "cursor": entries[-1][0].decode("utf-8") if entries else after}
 
 async def bot_get_events(bot_id: int, filter: list = None, exclude: list = None):
     # As a replacement/addition to webhooks, we have API events as well to allow you to quickly get old and new events with their epoch
@@ -3,10 +3,14 @@ Helper functions for mundane tasks like getting maint, promotion or bot commands
 and/or setting bot stats and voting for a bot. Also has replace tuples to be handled
 """
 
+import base64
+import hashlib
 import re
+from collections import Counter
 
 import asyncpg
 import bleach
+import markdown
 from fastapi import datastructures
 from lxml.html.clean import Cleaner
 
@@ -25,6 +29,72 @@ ldesc_replace_tuple = (("window.location", ""), ("document.ge", ""))
 
 cleaner = Cleaner(remove_unknown_tags=False)
 
+# Take the h1...h5 anad drop it one lower and bypass peoples stupidity 
+# and some nice patches to the site to improve accessibility
+long_desc_replace_tuple = (
+    ("<h1", "<h3"),
+    ("</h1", "</h3"),
+    ("<h2", "<h4"),
+    ("</h2", "</h4"),
+    ("<a", "<a class='long-desc-link ldlink'"), 
+    ("<!DOCTYPE", ""), 
+    ("html>", ""), 
+    ("<body", ""), 
+    ("<div", "<article"),
+    ("</div", "</article"),
+    (".click", ""),
+    ("bootstrap.min.css", ""),
+    ("bootstrap.css", ""), 
+    ("jquery.min.js", ""), 
+    ("jquery.js", ""), 
+    ("fetch(", "")
+)
+
+long_desc_cleaner = Cleaner()
+LONG_DESC_CACHE_EXPIRY = 60*60*24*7
+
+def render_long_description(long_description: str, long_description_type: int, lang: str, js_allowed: bool) -> str:
+    """Renders a long description to the final sanitised HTML shown on the bot page"""
+    long_description = intl_text(long_description, lang)
+    if long_description_type == enums.LongDescType.markdown_pymarkdown: # If we are using markdown
+        ldesc = emd(markdown.markdown(long_description, extensions = md_extensions))
+    else: 
+        ldesc = long_description
+
+    if not js_allowed:
+        try:
+            ldesc = long_desc_cleaner.clean_html(ldesc)
+        except Exception:
+            ldesc = bleach.clean(ldesc)
+
+    ldesc = ireplacem(long_desc_replace_tuple, ldesc)
+    return ireplacem(ldesc_replace_tuple, ldesc)
+
+def _long_desc_key(bot_id: int, long_description: str, long_description_type: int, lang: str, js_allowed: bool) -> str:
+    content_hash = hashlib.sha256(f"{long_description_type}\0{long_description}".encode("utf-8")).hexdigest()[:32]
+    return f"fl:ldesc:{bot_id}:{content_hash}:{lang}:{int(bool(js_allowed))}"
+
+async def get_long_description(redis, bot_id: int, long_description: str, long_description_type: int, lang: str, js_allowed: bool) -> str:
+    """Gets the rendered long description of a bot from the render cache, rendering it on a miss"""
+    key = _long_desc_key(bot_id, long_description, long_description_type, lang, js_allowed)
+    ldesc = await redis.get(key)
+    if ldesc is not None:
+        return ldesc.decode("utf-8")
+    ldesc = render_long_description(long_description, long_description_type, lang, js_allowed)
+    await redis.set(key, ldesc, ex = LONG_DESC_CACHE_EXPIRY)
+    return ldesc
+
+async def cache_long_description(redis, bot_id: int, long_description: str, long_description_type: int, lang: str = "default"):
+    """Renders a long description for both js modes into the render cache (on bot edit)"""
+    async with redis.pipeline(transaction=False) as pipe:
+        for js_allowed in (True, False):
+            pipe.set(
+                _long_desc_key(bot_id, long_description, long_description_type, lang, js_allowed),
+                render_long_description(long_description, long_description_type, lang, js_allowed),
+                ex = LONG_DESC_CACHE_EXPIRY
+            )
+        await pipe.execute()
+
 def id_check(check_t: str):
     def check(id: int, fn: str):
         if id > INT64_MAX:
@@ -43,6 +113,74 @@ def id_check(check_t: str):
 def worker_session(request: Request):
     return request.app.state.worker_session
 
+BOT_PAGE_TTL = 60 # Staleness budget of cached bot pages (votes, guild count etc.)
+
+async def get_bot_page_cache(redis, bot_id: int, field: str):
+    """Gets a cached bot page part (html:<lang> or data:<lang>:<js>), None if missing or older than BOT_PAGE_TTL"""
+    entry = await redis.hget(f"fl:botpage:{bot_id}", field)
+    if not entry:
+        return None
+    entry = orjson.loads(entry)
+    if time.time() - entry["ts"] > BOT_PAGE_TTL:
+        return None
+    return entry["v"]
+
+async def set_bot_page_cache(redis, bot_id: int, field: str, value):
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(f"fl:botpage:{bot_id}", field, orjson.dumps({"ts": time.time(), "v": value}))
+        pipe.expire(f"fl:botpage:{bot_id}", BOT_PAGE_TTL*2)
+        await pipe.execute()
+
+async def bot_page_invalidate(redis, bot_id: int):
+    """Drops all cached pages of a bot (on edits, promotion and review changes)"""
+    await redis.delete(f"fl:botpage:{bot_id}")
+
+# Loads a bot with its tags, owners (deduped, main first), promotions and vanity in one round trip
+bot_loader_query = """
+SELECT bots.bot_id, bots.js_allowed, bots.prefix, bots.shard_count, bots.shards, bots.state, bots.description, 
+bots.bot_library AS library, bots.website, bots.votes, bots.guild_count, bots.user_count, bots.discord AS support, 
+bots.banner_page, bots.banner_card, bots.github, bots.features, bots.invite, bots.invite_amount, bots.css, 
+bots.long_description_type, bots.long_description, bots.donate, bots.privacy_policy, bots.nsfw, 
+bots.keep_banner_decor, bots.last_stats_post, bots.created_at,
+COALESCE((SELECT array_agg(tag) FROM bot_tags WHERE bot_tags.bot_id = bots.bot_id), '{}') AS tags,
+COALESCE(owners.owners, '{}') AS owners, 
+COALESCE(owners.mains, '{}') AS owner_mains,
+COALESCE(
+    (SELECT json_agg(json_build_object('id', id, 'title', title, 'info', info, 'css', css, 'type', type)) FROM bot_promotions WHERE bot_promotions.bot_id = bots.bot_id), 
+    '[]'
+) AS promos,
+(SELECT vanity_url FROM vanity WHERE vanity.redirect = bots.bot_id LIMIT 1) AS vanity
+FROM bots LEFT JOIN LATERAL (
+    SELECT array_agg(owner ORDER BY main DESC) AS owners, array_agg(main ORDER BY main DESC) AS mains FROM (
+        SELECT DISTINCT ON (owner) owner, main FROM bot_owner WHERE bot_owner.bot_id = bots.bot_id ORDER BY owner, main DESC
+    ) bot_owners
+) owners ON true
+WHERE bots.bot_id = $1
+"""
+
+async def load_bot(worker_session, bot_id: int, *, users: bool = True) -> Optional[dict]:
+    """
+    Loads a bot (see bot_loader_query). If users is set, the bot user (user) and the 
+    owners ({"user": user, "main": main}, missing users are skipped) are fetched in one batched cache call. 
+    Otherwise both are None
+    """
+    bot = await worker_session.postgres.fetchrow(bot_loader_query, bot_id)
+    if bot is None:
+        return None
+    bot = dict(bot)
+    bot["promos"] = orjson.loads(bot["promos"])
+    owners = list(zip(bot["owners"], bot.pop("owner_mains")))
+    bot["owners"], bot["user"] = None, None
+    if not users:
+        return bot
+
+    fetched = await get_any_many([bot_id] + [owner for owner, _ in owners], worker_session = worker_session)
+    bot["user"] = fetched[0] if fetched[0] and fetched[0]["bot"] else None
+    bot["owners"] = [
+        {"user": user, "main": main} for user, (_, main) in zip(fetched[1:], owners) if user and not user["bot"]
+    ]
+    return bot
+
 async def get_promotions(bot_id: int) -> list:
     api_data = await db.fetch("SELECT id, title, info, css, type FROM bot_promotions WHERE bot_id = $1", bot_id)
     return api_data
@@ -91,57 +229,169 @@ async def add_promotion(bot_id: int, title: str, info: str, css: str, type: int)
     if css is not None:
         css = css.replace("</style", "").replace("<script", "")
     info = info.replace("</style", "").replace("<script", "")
-    return await db.execute("INSERT INTO bot_promotions (bot_id, title, info, css, type) VALUES ($1, $2, $3, $4, $5)", bot_id, title, info, css, type)
+    ret = await db.execute("INSERT INTO bot_promotions (bot_id, title, info, css, type) VALUES ($1, $2, $3, $4, $5)", bot_id, title, info, css, type)
+    await bot_page_invalidate(redis_db, bot_id)
+    return ret
 
-async def vote_bot(redis, db, user_id: int, bot_id: int, test: bool = False) -> Optional[tuple]:
-    if bot_id != 733043768692965448:
-        check = await redis.ttl(f"vote_lock:{user_id}")
-        if not test and check != -2:
-            return check 
+VOTE_STREAM_KEY = "fl:votes" # Votes waiting to be applied by the primary worker
+VOTE_STREAM_GROUP = "apply"
+VOTE_BATCH_SIZE = 500
+VOTE_DEAD_STREAM_KEY = "fl:votes:dead" # Votes which failed to apply VOTE_MAX_ATTEMPTS times
+VOTE_MAX_ATTEMPTS = 5
+VOTE_ENTRY_RETENTION = 60*60*24 # Seconds applied stream entry ids are kept for deduplication
 
-    bot_check = await db.fetchval("SELECT COUNT(1) FROM bots WHERE bot_id = $1", bot_id)
-    if not bot_check:
+async def vote_bot(redis, db, user_id: int, bot_id: int, test: bool = False) -> Optional[tuple]:
+    """
+    Takes the vote lock and queues the vote on the vote stream. The vote count, voters 
+    and vote stats are updated in batches by the primary worker (see apply_votes)
+    """
+    lock = bot_id != 733043768692965448
+    lock_key = f"vote_lock:{user_id}"
+    if lock:
+        if test:
+            await redis.set(lock_key, bot_id, ex=60*60*8)
+
+        # Only one of many concurrent votes can take the lock
+        elif not await redis.set(lock_key, bot_id, ex=60*60*8, nx=True):
+            return max(await redis.ttl(lock_key), 0)
+
+    try:
+        votes = await db.fetchval("SELECT votes FROM bots WHERE bot_id = $1", bot_id)
+        if votes is not None:
+            await redis.xadd(VOTE_STREAM_KEY, {
+                "bot_id": bot_id, 
+                "user_id": user_id, 
+                "ts": time.time(), 
+                "count": int(lock), # Whether the vote counts towards the bots votes
+                "record": int(not test) # Whether the voter and vote stats are updated
+            })
+    except Exception:
+        if lock and not test:
+            await redis.delete(lock_key)
+        raise
+
+    if votes is None:
+        # Bot does not exist
+        if lock and not test:
+            await redis.delete(lock_key)
         return None
 
-    votes = await db.fetchval("SELECT votes FROM bots WHERE bot_id = $1", bot_id)
-
-    if bot_id != 733043768692965448:
-        await redis.set(f"vote_lock:{user_id}", bot_id, ex=60*60*8)
-        await db.execute("UPDATE bots SET votes = votes + 1 WHERE bot_id = $1", bot_id)
-
-    asyncio.create_task(bot_add_event(bot_id, enums.APIEvents.bot_vote, {"user": str(user_id), "votes": votes + 1, "test": test}))
-
-    if test:
-        return True
-
-    asyncio.create_task(_extra_vote_task(db, user_id, bot_id, votes))
+    asyncio.create_task(bot_add_event(bot_id, enums.APIEvents.bot_vote, {"user": str(user_id), "votes": votes + int(lock), "test": test}))
     return True
 
-async def _extra_vote_task(db, user_id, bot_id, votes):
-    ts = await db.fetchval("SELECT timestamps FROM bot_voters WHERE bot_id = $1 AND user_id = $2", bot_id, user_id)
-
-    if ts is None:
-        await db.execute("INSERT INTO bot_voters (user_id, bot_id) VALUES ($1, $2)", user_id, bot_id)
-    else:
-        await db.execute("UPDATE bot_voters SET timestamps = array_append(timestamps, NOW()) WHERE bot_id = $1 AND user_id = $2", bot_id, user_id)
-
-    # Update bot_stats
-    check = await db.fetchrow("SELECT bot_id FROM bot_stats_votes WHERE bot_id = $1", bot_id)
-    if check is None:
-        await db.execute("INSERT INTO bot_stats_votes (bot_id, total_votes) VALUES ($1, $2)", bot_id, votes + 1)
-    else:
-        await db.execute("UPDATE bot_stats_votes SET total_votes = total_votes + 1 WHERE bot_id = $1", bot_id)
+async def apply_votes(db, redis, entries: list):
+    """
+    Applies a batch of votes from the vote stream in one transaction. Entries are recorded in 
+    vote_entries first so a redelivered entry is never applied twice. Returns the bot ids whose votes changed
+    """
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            applied = await conn.fetch(
+                "INSERT INTO vote_entries (id) SELECT unnest($1::text[]) ON CONFLICT (id) DO NOTHING RETURNING id",
+                [entry_id.decode("utf-8") for entry_id, _ in entries]
+            )
+            applied = {row["id"] for row in applied}
+
+            counts, records = Counter(), []
+            for entry_id, vote in entries:
+                if entry_id.decode("utf-8") not in applied:
+                    continue # Already applied
+                bot_id = int(vote[b"bot_id"])
+                counts[bot_id] += int(vote[b"count"])
+                if int(vote[b"record"]):
+                    records.append((bot_id, int(vote[b"user_id"]), datetime.datetime.fromtimestamp(float(vote[b"ts"]), tz = datetime.timezone.utc)))
+
+            counts = {bot_id: count for bot_id, count in counts.items() if count}
+            if not counts and not records:
+                return []
+            record_bots, record_users, record_ts = (list(col) for col in zip(*records)) if records else ([], [], [])
+
+            if counts:
+                await conn.execute(
+                    """UPDATE bots SET votes = bots.votes + v.amount 
+                    FROM unnest($1::bigint[], $2::bigint[]) AS v(bot_id, amount) WHERE bots.bot_id = v.bot_id""",
+                    list(counts.keys()),
+                    list(counts.values())
+                )
+            if records:
+                await conn.execute(
+                    """INSERT INTO bot_votes (bot_id, user_id, ts) 
+                    SELECT v.bot_id, v.user_id, v.ts FROM unnest($1::bigint[], $2::bigint[], $3::timestamptz[]) AS v(bot_id, user_id, ts) 
+                    WHERE EXISTS (SELECT 1 FROM bots WHERE bots.bot_id = v.bot_id)""",
+                    record_bots, record_users, record_ts
+                )
+                await conn.execute(
+                    """INSERT INTO bot_voters (bot_id, user_id, votes, last_voted) 
+                    SELECT v.bot_id, v.user_id, COUNT(*), MAX(v.ts) FROM unnest($1::bigint[], $2::bigint[], $3::timestamptz[]) AS v(bot_id, user_id, ts) 
+                    WHERE EXISTS (SELECT 1 FROM bots WHERE bots.bot_id = v.bot_id) GROUP BY v.bot_id, v.user_id
+                    ON CONFLICT (bot_id, user_id) DO UPDATE SET votes = bot_voters.votes + EXCLUDED.votes, last_voted = GREATEST(bot_voters.last_voted, EXCLUDED.last_voted)""",
+                    record_bots, record_users, record_ts
+                )
+                record_counts = Counter(record_bots)
+                await conn.execute(
+                    """INSERT INTO bot_stats_votes (bot_id, total_votes) 
+                    SELECT v.bot_id, v.amount FROM unnest($1::bigint[], $2::bigint[]) AS v(bot_id, amount) 
+                    WHERE EXISTS (SELECT 1 FROM bots WHERE bots.bot_id = v.bot_id)
+                    ON CONFLICT (bot_id) DO UPDATE SET total_votes = bot_stats_votes.total_votes + EXCLUDED.total_votes""",
+                    list(record_counts.keys()),
+                    list(record_counts.values())
+                )
+                await conn.execute(
+                    """INSERT INTO bot_stats_votes_pm (bot_id, month, votes) 
+                    SELECT v.bot_id, to_char(v.ts AT TIME ZONE 'UTC', 'YYYYMM')::integer, COUNT(*) FROM unnest($1::bigint[], $2::timestamptz[]) AS v(bot_id, ts) 
+                    WHERE EXISTS (SELECT 1 FROM bots WHERE bots.bot_id = v.bot_id) GROUP BY 1, 2
+                    ON CONFLICT (bot_id, month) DO UPDATE SET votes = bot_stats_votes_pm.votes + EXCLUDED.votes""",
+                    record_bots, record_ts
+                )
+    return list(counts.keys())
+
+async def get_voter(db, bot_id: int, user_id: int, *, vts_limit: int = 10, vts_before: Optional[str] = None) -> Optional[dict]:
+    """
+    Gets the vote count of a user on a bot from the count cache and a page of their 
+    vote timestamps (newest first). Pass the returned cursor as vts_before to get the next page. 
+    Returns None if the cursor is invalid
+    """
+    before = (None, None)
+    if vts_before:
+        before = decode_cursor(vts_before)
+        try:
+            before = datetime.datetime.fromisoformat(before[0]), int(before[1])
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    votes = await db.fetchval("SELECT votes FROM bot_voters WHERE bot_id = $1 AND user_id = $2", bot_id, user_id) or 0
+    vts = []
+    if votes and vts_limit:
+        vts = await db.fetch(
+            """SELECT ts, id FROM bot_votes WHERE user_id = $1 AND bot_id = $2 
+            AND ($3::timestamptz IS NULL OR (ts, id) < ($3::timestamptz, $4::bigint)) 
+            ORDER BY ts DESC, id DESC LIMIT $5""",
+            user_id, 
+            bot_id, 
+            *before,
+            vts_limit + 1
+        )
+    cursor = encode_cursor(vts[vts_limit - 1]["ts"].isoformat(), vts[vts_limit - 1]["id"]) if len(vts) > vts_limit else None
+    return {
+        "votes": votes, 
+        "vts": [vote["ts"] for vote in vts[:vts_limit]], 
+        "cursor": cursor
+    }
+
+def bot_invite_url(bot_id: int, invite: Optional[str]) -> str:
+    """Returns the invite link of a bot given its invite (a P:<perms> invite or none means the default oauth invite)"""
+    if not invite or invite.startswith("P:"):
+        perm = invite.split(":")[1].split("|")[0] if invite and invite.startswith("P:") else 0
+        return f"https://discord.com/api/oauth2/authorize?client_id={bot_id}&permissions={perm}&scope=bot%20applications.commands"
+    return invite
 
 async def invite_bot(bot_id: int, user_id = None, api = False):
-    bot = await db.fetchrow("SELECT invite, invite_amount FROM bots WHERE bot_id = $1", bot_id)
+    bot = await db.fetchrow("SELECT invite FROM bots WHERE bot_id = $1", bot_id)
     if bot is None:
         return None
     if not bot["invite"] or bot["invite"].startswith("P:"):
-        perm = bot["invite"].split(":")[1].split("|")[0] if bot["invite"] and bot["invite"].startswith("P:") else 0
-        return f"https://discord.com/api/oauth2/authorize?client_id={bot_id}&permissions={perm}&scope=bot%20applications.commands"
-    if not api:
-        await db.execute("UPDATE bots SET invite_amount = $1 WHERE bot_id = $2", bot["invite_amount"] + 1, bot_id)
-    await add_ws_event(bot_id, {"m": {"e": enums.APIEvents.bot_invite}, "ctx": {"user": str(user_id), "api": api}})
+        return bot_invite_url(bot_id, bot["invite"])
+    event_buffer.add(bot_id, {"m": {"e": enums.APIEvents.bot_invite}, "ctx": {"user": str(user_id), "api": api}}, invite = not api)
     return bot["invite"]
 
 # Check vanity of bot 
@@ -172,9 +422,9 @@ async def parse_index_query(worker_session, fetch: List[asyncpg.Record]) -> list
     Parses a index query to a list of partial bots
     """
     lst = []
-    for bot in fetch:
-        banner_replace_tup = (("\"", ""), ("'", ""), ("http://", "https://"), ("file://", ""))
-        _user = await get_bot(bot["bot_id"], worker_session = worker_session)
+    banner_replace_tup = (("\"", ""), ("'", ""), ("http://", "https://"), ("file://", ""))
+    users = await get_bots_many([bot["bot_id"] for bot in fetch], worker_session = worker_session)
+    for bot, _user in zip(fetch, users):
         if _user:
             bot_obj = dict(bot) | {
                 "user": _user,
@@ -184,6 +434,28 @@ async def parse_index_query(worker_session, fetch: List[asyncpg.Record]) -> list
             lst.append(bot_obj)
     return lst
 
+# Orderings a index query may use
+index_orders = (
+    "",
+    "ORDER BY votes DESC",
+    "ORDER BY created_at DESC",
+    "ORDER BY created_at ASC",
+)
+
+def index_query(add_query: str = "") -> str:
+    """
+    Returns the SQL for a index query. $1 is the list of states and $2 the limit (NULL for no limit).
+    There is only one statement per ordering so asyncpg's statement cache stays hot
+    """
+    if add_query not in index_orders:
+        raise ValueError(f"Invalid index query ordering: {add_query}")
+    return " ".join((
+        "SELECT description, banner_card AS banner, state, votes, guild_count, bot_id, invite, nsfw FROM bots", 
+        "WHERE state = ANY($1::int[])",
+        add_query, 
+        "LIMIT $2"
+    ))
+
 async def do_index_query(
     worker_session,
     add_query: str = "",
@@ -191,20 +463,209 @@ async def do_index_query(
     limit: Optional[int] = 12
 ) -> List[asyncpg.Record]:
     """
-    Performs a 'index' query which can also be used by other things as well
+    Performs a 'index' query which can also be used by other things as well. add_query must be one of index_orders
     """
     db = worker_session.postgres
-    
-    states = "WHERE " + " OR ".join([f"state = {s}" for s in state])
-    base_query = f"SELECT description, banner_card AS banner, state, votes, guild_count, bot_id, invite, nsfw FROM bots {states}"
-    if limit:
-        end_query = f"LIMIT {limit}"
-    else:
-        end_query = ""
-    logger.debug(base_query, add_query, end_query)
-    fetch = await db.fetch(" ".join((base_query, add_query, end_query)))
+    fetch = await db.fetch(index_query(add_query), [int(s) for s in state], limit)
     return await parse_index_query(worker_session, fetch)
 
+def encode_cursor(*values) -> str:
+    """Encodes the sort key of the last row of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode("utf-8")
+
+def decode_cursor(cursor: str) -> Optional[list]:
+    """Decodes a cursor made by encode_cursor, None if the cursor is invalid"""
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+# Keyset query, bots in the given states oldest first. $2 and $3 are the created_at and bot id of the cursor (NULL for the first page)
+keyset_query = """
+SELECT description, banner_card AS banner, state, votes, guild_count, bot_id, invite, nsfw, created_at FROM bots 
+WHERE state = ANY($1::int[]) AND ($2::timestamptz IS NULL OR (created_at, bot_id) > ($2::timestamptz, $3::bigint)) 
+ORDER BY created_at, bot_id LIMIT $4
+"""
+
+def bot_key(bot) -> tuple:
+    """Keyset key of a bot row ordered by (created_at, bot_id)"""
+    return bot["created_at"], int(bot["bot_id"])
+
+def bot_cursor(bot) -> str:
+    """Cursor of a bot row ordered by (created_at, bot_id)"""
+    return encode_cursor(bot["created_at"].isoformat(), int(bot["bot_id"]))
+
+def bot_cursor_key(cursor: Optional[str]) -> Optional[tuple]:
+    """Decodes a bot_cursor to (created_at, bot_id), (None, None) for the first page and None if it is invalid"""
+    if not cursor:
+        return None, None
+    values = decode_cursor(cursor)
+    try:
+        return datetime.datetime.fromisoformat(values[0]), int(values[1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+async def do_keyset_query(
+    worker_session,
+    state: list,
+    after: Optional[str] = None,
+    limit: int = 100
+) -> Optional[tuple]:
+    """
+    Gets a page of bots in the given states (oldest first) after a cursor.
+    Returns the bots and the cursor of the next page (None on the last page) or None if the cursor is invalid
+    """
+    key = bot_cursor_key(after)
+    if key is None:
+        return None
+    fetch = await worker_session.postgres.fetch(keyset_query, [int(s) for s in state], *key, limit + 1)
+    cursor = bot_cursor(fetch[limit - 1]) if len(fetch) > limit else None
+    return await parse_index_query(worker_session, fetch[:limit]), cursor
+
+# Index sections stored in the index snapshot
+index_sections = {
+    "top_voted": {"add_query": "ORDER BY votes DESC", "state": [0]},
+    "new_bots": {"add_query": "ORDER BY created_at DESC", "state": [0]},
+    "certified_bots": {"add_query": "ORDER BY votes DESC", "state": [6]},
+}
+
+# Sections to rebuild for a refresh reason, all sections are rebuilt for any other reason
+index_refresh_sections = {
+    "vote": ("top_voted", "certified_bots"),
+}
+
+INDEX_SNAPSHOT_KEY = "fl:index"
+INDEX_SNAPSHOT_INTERVAL = 60
+
+async def build_index_snapshot(worker_session, sections: Optional[tuple] = None) -> dict:
+    """
+    Builds the index snapshot (all index sections with their users) and stores it in redis. 
+    If sections is given, only those sections of the current snapshot are rebuilt
+    """
+    redis = worker_session.redis
+    snapshot = None
+    if sections:
+        snapshot = await redis.get(INDEX_SNAPSHOT_KEY)
+        snapshot = orjson.loads(snapshot) if snapshot else None
+    if not snapshot:
+        snapshot, sections = {}, index_sections.keys()
+
+    for section in sections:
+        snapshot[section] = await do_index_query(worker_session, **index_sections[section])
+    snapshot["epoch"] = time.time()
+    await redis.set(INDEX_SNAPSHOT_KEY, orjson.dumps(snapshot), ex = INDEX_SNAPSHOT_INTERVAL*5)
+    return snapshot
+
+async def get_index_snapshot(worker_session) -> dict:
+    """Gets the index snapshot, building it if the primary worker has not done so yet"""
+    snapshot = await worker_session.redis.get(INDEX_SNAPSHOT_KEY)
+    if snapshot:
+        return orjson.loads(snapshot)
+    return await build_index_snapshot(worker_session)
+
+async def request_index_refresh(redis, reason: str):
+    """Asks the primary worker to refresh the index snapshot (INDEXREFRESH <REASON>)"""
+    await redis.publish("_worker_fates", f"INDEXREFRESH {reason}")
+
+PROFILE_SEARCH_KEY = "fl:profilesearch" # Sorted set of <TERM>\0<USER ID> (all scores 0, for lex range queries)
+PROFILE_SEARCH_TERMS_KEY = "fl:profilesearch_terms" # User id -> terms of the user in the sorted set
+PROFILE_SEARCH_LOCK_KEY = "fl:profilesearch_lock" # Held while a worker rebuilds a missing index
+PROFILE_SEARCH_DESC_WORDS = 32 # Maximum words of a bot description indexed
+
+async def _profile_search_terms(db, owner_ids: Optional[List[int]] = None) -> dict:
+    """
+    Gets the search terms (username and the names, ids and descriptions of approved/certified bots) of users. 
+    Descriptions are indexed as a whole and word by word so any word of them can be searched for
+    """
+    rows = await db.fetch(
+        """SELECT users.user_id, users.username, bots.bot_id, bots.username_cached, bots.description FROM users 
+        LEFT JOIN bot_owner ON bot_owner.owner = users.user_id 
+        LEFT JOIN bots ON bots.bot_id = bot_owner.bot_id AND (bots.state = 0 OR bots.state = 6) 
+        WHERE $1::bigint[] IS NULL OR users.user_id = ANY($1::bigint[])""",
+        owner_ids
+    )
+    terms = {owner_id: set() for owner_id in owner_ids} if owner_ids else {}
+    for row in rows:
+        user_terms = terms.setdefault(row["user_id"], set())
+        if row["username"]:
+            user_terms.add(row["username"].lower())
+        if row["bot_id"]:
+            user_terms.add(str(row["bot_id"]))
+            if row["username_cached"]:
+                user_terms.add(row["username_cached"].lower())
+            if row["description"]:
+                description = row["description"].lower().strip()
+                user_terms.add(description[:100])
+                user_terms.update(re.findall(r"\w{3,}", description)[:PROFILE_SEARCH_DESC_WORDS])
+    return {
+        owner_id: [f"{term}\0{owner_id}".encode("utf-8") for term in user_terms] 
+        for owner_id, user_terms in terms.items()
+    }
+
+async def profile_search_index(db, redis, owner_ids: Optional[List[int]] = None):
+    """
+    Updates the profile search index for the given owners. Call this whenever 
+    ownership of a bot changes. If owner_ids is None, the whole index is rebuilt 
+    (unless another worker is already rebuilding it)
+    """
+    if owner_ids is None:
+        if not await redis.set(PROFILE_SEARCH_LOCK_KEY, 1, ex = 60*5, nx = True):
+            return
+        try:
+            terms = await _profile_search_terms(db)
+
+            # Build into temporary keys and swap them in so searches never see a empty index
+            tmp_key, tmp_terms_key = f"{PROFILE_SEARCH_KEY}:tmp", f"{PROFILE_SEARCH_TERMS_KEY}:tmp"
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.delete(tmp_key, tmp_terms_key)
+                for owner_id, members in terms.items():
+                    if members:
+                        pipe.zadd(tmp_key, {member: 0 for member in members})
+                    pipe.hset(tmp_terms_key, key = str(owner_id), value = orjson.dumps([member.decode("utf-8") for member in members]))
+                # RENAME fails on keys which were never created (no users or no terms)
+                if any(terms.values()):
+                    pipe.rename(tmp_key, PROFILE_SEARCH_KEY)
+                else:
+                    pipe.delete(PROFILE_SEARCH_KEY)
+                if terms:
+                    pipe.rename(tmp_terms_key, PROFILE_SEARCH_TERMS_KEY)
+                else:
+                    pipe.delete(PROFILE_SEARCH_TERMS_KEY)
+                await pipe.execute()
+        finally:
+            await redis.delete(PROFILE_SEARCH_LOCK_KEY)
+        return
+
+    terms = await _profile_search_terms(db, [int(owner_id) for owner_id in owner_ids])
+    if not terms:
+        return
+    old_terms = await redis.hmget(PROFILE_SEARCH_TERMS_KEY, [str(owner_id) for owner_id in terms.keys()])
+    async with redis.pipeline(transaction=True) as pipe:
+        for (owner_id, members), old_members in zip(terms.items(), old_terms):
+            if old_members:
+                old_members = [member.encode("utf-8") for member in orjson.loads(old_members)]
+                if old_members:
+                    pipe.zrem(PROFILE_SEARCH_KEY, *old_members)
+            if members:
+                pipe.zadd(PROFILE_SEARCH_KEY, {member: 0 for member in members})
+            pipe.hset(PROFILE_SEARCH_TERMS_KEY, key = str(owner_id), value = orjson.dumps([member.decode("utf-8") for member in members]))
+        await pipe.execute()
+
+async def profile_search(db, redis, q: str, limit: int = 12) -> List[int]:
+    """Returns the ids of users whose username, bot name, bot id, bot description or a word of it starts with q"""
+    if not await redis.exists(PROFILE_SEARCH_KEY):
+        await profile_search_index(db, redis) # Only one worker rebuilds, the others search the (empty) index meanwhile
+
+    prefix = q.lower().strip().encode("utf-8")
+    members = await redis.zrangebylex(PROFILE_SEARCH_KEY, b"[" + prefix, b"[" + prefix + b"\xff", start = 0, num = limit*4)
+    owner_ids = []
+    for member in members:
+        owner_id = int(member.rsplit(b"\0", 1)[1])
+        if owner_id not in owner_ids:
+            owner_ids.append(owner_id)
+    return owner_ids[:limit]
+
 async def vanity_check(id, vanity):
     """Check if a vanity exists or not given a id and a vanity"""
     if vanity.replace(" ", "") == "":
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import time
 import uuid
 import warnings
@@ -6,33 +7,122 @@ import warnings
 import orjson
 from loguru import logger
 
+# Dragon publishes the reply to a command id of the form <UUID>@<PID> on this channel + PID
+REPLY_CHANNEL = "_worker_fates_reply-"
+
+# Replies are also checked with a single GET every this many seconds in case a publish was missed
+REPLY_POLL_INTERVAL = 1
+
+
+class IPCStats():
+    """Counters to see IPC pressure on a worker"""
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = 0
+        self.timeouts = 0
+        self.latency_sum = 0
+        self.latency = [0] * (len(self.buckets) + 1) # Last bucket is +Inf
+
+    def observe(self, latency: float):
+        """Record the latency of a completed call"""
+        self.latency_sum += latency
+        for i, bucket in enumerate(self.buckets):
+            if latency <= bucket:
+                self.latency[i] += 1
+                return
+        self.latency[-1] += 1
+
+    def dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "in_flight": self.in_flight,
+            "timeouts": self.timeouts,
+            "latency_sum": self.latency_sum,
+            "latency": {str(bucket): count for bucket, count in zip(self.buckets + ("inf",), self.latency)}
+        }
+
+
+ipc_stats = IPCStats()
+
+_replies = {} # Command id -> future waiting for the reply
+_listener = None # Reply listener task
+
+
+async def _reply_listener(redis, ready: asyncio.Event):
+    """Subscribes once to this workers reply channel and resolves the futures of waiting IPC calls"""
+    pubsub = redis.pubsub()
+    try:
+        await pubsub.subscribe(f"{REPLY_CHANNEL}{os.getpid()}")
+        ready.set()
+        async for msg in pubsub.listen():
+            if not msg or not isinstance(msg.get("data"), bytes):
+                continue
+            cmd_id, _, data = msg["data"].partition(b" ")
+            fut = _replies.get(cmd_id.decode("utf-8"))
+            if fut and not fut.done():
+                fut.set_result(data)
+    except Exception as exc:
+        logger.warning(f"IPC reply listener stopped, falling back to polling: {exc}")
+    finally:
+        ready.set()
+        await pubsub.close()
+
+
+async def _ensure_listener(redis):
+    """Starts the reply listener for this worker if it is not running yet"""
+    global _listener
+    loop = asyncio.get_running_loop()
+    if _listener and not _listener.done() and _listener.get_loop() is loop:
+        return
+    ready = asyncio.Event()
+    _listener = asyncio.create_task(_reply_listener(redis, ready))
+    await ready.wait()
+
 
 async def redis_ipc_new(redis, cmd, msg = None, timeout=30, args: list = None):
     args = [] if not args else args
-    cmd_id = str(uuid.uuid4())
+    cmd_id = f"{uuid.uuid4()}@{os.getpid()}"
     if msg:
         msg_id = str(uuid.uuid4())
         await redis.set(msg_id, orjson.dumps(msg), ex=30)
         args.append(msg_id)
     args = " ".join(args)
+
+    if timeout:
+        await _ensure_listener(redis)
+        fut = asyncio.get_running_loop().create_future()
+        _replies[cmd_id] = fut
+
     if args:
         await redis.publish("_worker_fates", f"{cmd} {cmd_id} {args}")
     else:
         await redis.publish("_worker_fates", f"{cmd} {cmd_id}")
-    
+
+    if not timeout:
+        return None
+
     async def wait(id):
         start_time = time.time()
-        while time.time() - start_time < timeout:
-            await asyncio.sleep(0)
-            data = await redis.get(id)
-            if data is None:
-                continue
-            return data
+        while (remaining := timeout - (time.time() - start_time)) > 0:
+            try:
+                return await asyncio.wait_for(asyncio.shield(fut), min(REPLY_POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                data = await redis.get(id)
+                if data is not None:
+                    return data
+        ipc_stats.timeouts += 1
 
-    if timeout:
+    ipc_stats.calls += 1
+    ipc_stats.in_flight += 1
+    start_time = time.time()
+    try:
         data = await wait(cmd_id)
-    else:
-        return None
+    finally:
+        ipc_stats.in_flight -= 1
+        ipc_stats.observe(time.time() - start_time)
+        _replies.pop(cmd_id, None)
     return data if data else None
 
 # Deprecated
@@ -1,3 +1,4 @@
+from .auth import resolve_token
 from .imports import *
 
 
@@ -20,16 +21,17 @@ async def rl_key_func(request: Request) -> str:
             r = request.headers["Authorization"]
         except KeyError:
             r = request.headers["authorization"]
-        check = await db.fetchrow("SELECT bot_id, state FROM bots WHERE api_token = $1", r) # Check api token
+        for scheme in ("Bot ", "User "):
+            if r.startswith(scheme):
+                r = r.replace(scheme, "", 1)
+        check = await resolve_token(r) # Check api token (bot or user)
         if check is None:
-            # Check user token too
-            check_user = await db.fetchval("SELECT user_id FROM users WHERE api_token = $1", r) # Check api token
-            if check_user is None:
-                return ip_check(request) # Invalid api token, fallback to ip
-            else:
-                return str(check_user)
-        if check["state"] == enums.BotState.certified:
+            return ip_check(request) # Invalid api token, fallback to ip
+        kind, id, state = check
+        if kind == "user":
+            return str(id)
+        if state == enums.BotState.certified:
             return None
-        return str(check["bot_id"]) # Otherwise, ratelimit using bot id
+        return str(id) # Otherwise, ratelimit using bot id
     else:
         return ip_check(request) # Fallback to ip
@@ -2,9 +2,7 @@
 Handles rendering of bots, index, search and profile search etc.
 """
 
-import bleach
-import markdown
-from lxml.html.clean import Cleaner
+import re
 
 from .events import *
 from .helpers import *
@@ -12,19 +10,15 @@ from .imports import *
 from .permissions import *
 from .templating import *
 
-cleaner = Cleaner()
-
 async def render_index(request: Request, api: bool, cert: bool):
     worker_session = request.app.state.worker_session
-    top_voted = await do_index_query(worker_session, add_query = "ORDER BY votes DESC", state = [0])
-    new_bots = await do_index_query(worker_session, add_query = "ORDER BY created_at DESC", state = [0])
-    certified_bots = await do_index_query(worker_session, add_query = "ORDER BY votes DESC", state = [6]) if cert else []
+    snapshot = await get_index_snapshot(worker_session)
 
     base_json = {
         "tags_fixed": tags_fixed, 
-        "top_voted": top_voted, 
-        "new_bots": new_bots, 
-        "certified_bots": certified_bots, 
+        "top_voted": snapshot["top_voted"], 
+        "new_bots": snapshot["new_bots"], 
+        "certified_bots": snapshot["certified_bots"] if cert else [], 
         "roll_api": "/api/bots/random"
     }
     if not api:
@@ -40,145 +34,128 @@ def gen_owner_html(owners_lst: tuple):
     owners_html += "<br/>".join([f"<a class='long-desc-link' href='/profile/{owner[0]}'>{owner[1]}</a>" for owner in owners_lst if owner])
     return owners_html
 
-async def render_bot(request: Request, bt: BackgroundTasks, bot_id: int, api: bool, rev_page: int = 1):
-    worker_session = request.app.state.worker_session
-    db = worker_session.postgres
-    if len(str(bot_id)) not in [17, 18, 19, 20]:
-        return abort(404)
-
-    if bot_id >= 9223372036854775807: # Max size of bigint
-        return abort(404)
-
-    check = await db.fetchval("SELECT bot_id FROM bots WHERE bot_id = $1", bot_id)
-    if not check:
-        return abort(404)
-
-    bot = await db.fetchrow(
-        """SELECT js_allowed, prefix, shard_count, state, description, bot_library AS library, 
-        website, votes, guild_count, discord AS support, banner_page AS banner, github, features, 
-        invite_amount, css, long_description_type, long_description, donate, privacy_policy, 
-        nsfw, keep_banner_decor, last_stats_post, created_at FROM bots WHERE bot_id = $1""", 
-        bot_id
-    )
-    tags = await db.fetch("SELECT tag FROM bot_tags WHERE bot_id = $1", bot_id)
-    if not tags:
-        return abort(404)
+async def _bot_page_data(worker_session, bot_id: int, lang: str, js_allowed: bool) -> Optional[Union[dict, str]]:
+    """
+    Gets the page data of a bot (the same for every viewer with the given language and js mode). 
+    Returns None if the bot does not exist or an error message if it cannot be shown
+    """
+    bot = await load_bot(worker_session, bot_id)
+    if not bot or not bot["tags"]:
+        return None
 
-
-    bot = dict(bot) | {"tags": [tag["tag"] for tag in tags]}
+    bot["banner"] = bot.pop("banner_page")
     
     # Ensure bot banner_page is disable if not approved or certified
     if bot["state"] not in (enums.BotState.approved, enums.BotState.certified):
         bot["banner"] = None
         bot["js_allowed"] = False
 
-    # Get all bot owners
-    owners = await db.fetch(
-        "SELECT DISTINCT ON (owner) owner, main FROM bot_owner WHERE bot_id = $1 ORDER BY owner, main DESC", 
-        bot_id
-    )
-    _owners = []
-    for owner in owners:
-        if owner["main"]: _owners.insert(0, owner)
-        else: _owners.append(owner)
-    owners = _owners
-    bot["description"] = intl_text(bot['description'], request.session.get("site_lang", "default"))   
-    bot['long_description'] = intl_text(bot['long_description'], request.session.get("site_lang", "default"))
-    if bot["long_description_type"] == enums.LongDescType.markdown_pymarkdown: # If we are using markdown
-        ldesc = emd(markdown.markdown(bot['long_description'], extensions = md_extensions))
-    else: 
-        ldesc = bot['long_description']
-
-    user_js_allowed = request.session.get("js_allowed", True)
-    if not user_js_allowed or not bot["js_allowed"]:
-        try:
-            ldesc = cleaner.clean_html(ldesc)
-        except Exception:
-            ldesc = bleach.clean(ldesc)
-
-        # Take the h1...h5 anad drop it one lower and bypass peoples stupidity 
-        # and some nice patches to the site to improve accessibility
-    long_desc_replace_tuple = (
-        ("<h1", "<h3"),
-        ("</h1", "</h3"),
-        ("<h2", "<h4"),
-        ("</h2", "</h4"),
-        ("<a", "<a class='long-desc-link ldlink'"), 
-        ("<!DOCTYPE", ""), 
-        ("html>", ""), 
-        ("<body", ""), 
-        ("<div", "<article"),
-        ("</div", "</article"),
-        (".click", ""),
-        ("bootstrap.min.css", ""),
-        ("bootstrap.css", ""), 
-        ("jquery.min.js", ""), 
-        ("jquery.js", ""), 
-        ("fetch(", "")
+    bot["description"] = intl_text(bot['description'], lang)   
+    ldesc = await get_long_description(
+        worker_session.redis, 
+        bot_id, 
+        bot["long_description"], 
+        bot["long_description_type"], 
+        lang, 
+        bool(js_allowed and bot["js_allowed"])
     )
-    ldesc = ireplacem(long_desc_replace_tuple, ldesc)
 
     if bot["banner"]:
         banner = bot["banner"].replace(" ", "%20").replace("\n", "")
     else:
         banner = ""
 
-    bot_info = await get_bot(bot_id, worker_session = worker_session)
-    
-    owners_lst = [
-        (await get_user(obj["owner"], user_only = True, worker_session = worker_session)) 
-        for obj in owners if obj["owner"] is not None
-    ]
-    owners_html = gen_owner_html(owners_lst)
+    owners_html = gen_owner_html([(owner["user"]["id"], owner["user"]["username"]) for owner in bot["owners"]])
     if bot["features"] is None:
         bot_features = ""
     else:
         bot_features = "<br/>".join([f"<a class='long-desc-link' href='/feature/{feature}'>{features[feature]['name']}</a>" for feature in bot["features"]])
     
-    if bot_info:
-        bot = dict(bot)
-        user = dict(bot_info)
-        user["name"] = user["username"]
-        bot_extra = {
-            "banner": ireplacem(banner_replace_tuple, banner),
-            "owners_html": owners_html, 
-            "features": bot_features,
-            "long_description": ireplacem(ldesc_replace_tuple, ldesc),
-            "user": user, 
-        }
-        bot |= bot_extra
-    
-    else:
-        return await templates.e(request, "Bot Not Found")
-    
-    _tags_fixed_bot = [tag for tag in tags_fixed if tag["id"] in bot["tags"]]
-    bt.add_task(add_ws_event, bot_id, {"m": {"e": enums.APIEvents.bot_view}, "ctx": {"user": request.session.get('user_id'), "widget": False}})
-    
-    context = {
-        "id": str(bot_id),
-        "bot_token": "",
-        "type": "bot",
-        "replace_list": long_desc_replace_tuple
+    if not bot["user"]:
+        return "Bot Not Found"
+
+    promos = bot.pop("promos")
+    user = dict(bot.pop("user"))
+    user["name"] = user["username"]
+    for key in ("owners", "bot_id", "banner_card", "shards", "user_count", "invite", "vanity"):
+        bot.pop(key)
+    bot |= {
+        "banner": ireplacem(banner_replace_tuple, banner),
+        "owners_html": owners_html, 
+        "features": bot_features,
+        "long_description": ldesc,
+        "user": user, 
     }
     
-    data = {
+    _tags_fixed_bot = [tag for tag in tags_fixed if tag["id"] in bot["tags"]]
+    return {
         "data": bot, 
         "type": "bot", 
         "id": bot_id, 
         "tags_fixed": _tags_fixed_bot, 
-        "promos": await get_promotions(bot_id),
+        "promos": promos,
         "guild": main_server, 
         "botp": True,
     }
 
+async def render_bot(request: Request, bt: BackgroundTasks, bot_id: int, api: bool, rev_page: int = 1):
+    worker_session = request.app.state.worker_session
+    redis = worker_session.redis
+    if len(str(bot_id)) not in [17, 18, 19, 20]:
+        return abort(404)
+
+    if bot_id >= 9223372036854775807: # Max size of bigint
+        return abort(404)
+
+    lang = request.session.get("site_lang", "default")
+    anon = "user_id" not in request.session.keys()
+
+    # Anonymous viewers all get the same page
+    if anon and not api:
+        html = await get_bot_page_cache(redis, bot_id, f"html:{lang}")
+        if html:
+            event_buffer.add(bot_id, {"m": {"e": enums.APIEvents.bot_view}, "ctx": {"user": None, "widget": False}})
+            return HTMLResponse(html)
+
+    js_allowed = bool(request.session.get("js_allowed", True)) # users.js_allowed may be NULL
+    data_key = f"data:{lang}:{int(js_allowed)}"
+    data = await get_bot_page_cache(redis, bot_id, data_key)
+    if data is None:
+        data = await _bot_page_data(worker_session, bot_id, lang, js_allowed)
+        if data is None:
+            return abort(404)
+        elif isinstance(data, str):
+            return await templates.e(request, data)
+        await set_bot_page_cache(redis, bot_id, data_key, data)
+    
+    event_buffer.add(bot_id, {"m": {"e": enums.APIEvents.bot_view}, "ctx": {"user": request.session.get('user_id'), "widget": False}})
+    
+    context = {
+        "id": str(bot_id),
+        "bot_token": "",
+        "type": "bot",
+        "replace_list": long_desc_replace_tuple
+    }
+
     if not api:
-        return await templates.TemplateResponse("bot_server.html", {"request": request, "replace_last": replace_last} | data, context = context)
+        # Logged in state (navbar, tokens etc.) is rendered on top of the cached page data
+        ret = await templates.TemplateResponse("bot_server.html", {"request": request, "replace_last": replace_last} | data, context = context)
+        if anon and ret.status_code == 200:
+            await set_bot_page_cache(redis, bot_id, f"html:{lang}", ret.body.decode("utf-8"))
+        return ret
     else:
         data["bot_id"] = str(bot_id)
         return data
 
 
-async def render_search(request: Request, q: str, api: bool):
+search_per_page = 6
+
+def search_tsquery(q: str) -> str:
+    """Makes a prefix matching tsquery out of a search query (every word must match)"""
+    words = re.findall(r"\w+", q.lower())[:8]
+    return " & ".join([f"{word}:*" for word in words])
+
+async def render_search(request: Request, q: str, api: bool, page: int = 1):
     worker_session = request.app.state.worker_session
     db = worker_session.postgres
     
@@ -187,28 +164,41 @@ async def render_search(request: Request, q: str, api: bool):
             return abort(404)
         else:
             return RedirectResponse("/")
-    bots = await db.fetch(
-        """SELECT DISTINCT bots.bot_id,
-        bots.description, bots.banner_card AS banner, bots.state, 
-        bots.votes, bots.guild_count, bots.invite, bots.nsfw
-        FROM bots 
-        INNER JOIN bot_owner ON bots.bot_id = bot_owner.bot_id 
-        WHERE (bots.description ilike $1 
-        OR bots.long_description ilike $1 
-        OR bots.username_cached ilike $1 
-        OR bot_owner.owner::text ilike $1)
-        ORDER BY bots.votes DESC, bots.guild_count DESC LIMIT 6
-        """, 
-        f'%{q}%'
-    )
+
+    page = page if page and page > 0 else 1
+    tsquery = search_tsquery(q)
+    if tsquery:
+        # Ranking blends the text score with votes and guild count
+        bots = await db.fetch(
+            """SELECT bots.bot_id,
+            bots.description, bots.banner_card AS banner, bots.state, 
+            bots.votes, bots.guild_count, bots.invite, bots.nsfw
+            FROM bots, to_tsquery('simple', $1) query 
+            WHERE (bots.search_vector @@ query 
+            OR bots.username_cached ilike $2 
+            OR bots.bot_id IN (SELECT bot_id FROM bot_owner WHERE owner = $3))
+            ORDER BY ts_rank_cd(bots.search_vector, query) 
+            + 0.05 * ln(1 + greatest(coalesce(bots.votes, 0), 0)) 
+            + 0.02 * ln(1 + greatest(coalesce(bots.guild_count, 0), 0)) DESC, 
+            bots.votes DESC 
+            LIMIT $4 OFFSET $5
+            """, 
+            tsquery,
+            f'{q.strip()}%',
+            int(q.strip()) if q.strip().isdigit() and int(q.strip()) < INT64_MAX else None,
+            search_per_page,
+            search_per_page*(page-1)
+        )
+    else:
+        bots = []
     search_bots = await parse_index_query(
         worker_session,
         bots, 
     )
     if not api:
-        return await templates.TemplateResponse("search.html", {"request": request, "search_bots": search_bots, "tags_fixed": tags_fixed, "query": q, "profile_search": False})
+        return await templates.TemplateResponse("search.html", {"request": request, "search_bots": search_bots, "tags_fixed": tags_fixed, "query": q, "profile_search": False, "page": page, "per_page": search_per_page})
     else:
-        return {"search_res": search_bots, "tags_fixed": tags_fixed, "query": q, "profile_search": False}
+        return {"search_res": search_bots, "tags_fixed": tags_fixed, "query": q, "profile_search": False, "page": page, "per_page": search_per_page}
 
 async def render_profile_search(request: Request, q: str, api: bool):
     worker_session = request.app.state.worker_session
@@ -220,20 +210,15 @@ async def render_profile_search(request: Request, q: str, api: bool):
         else:
             q = ""
     if q.replace(" ", "") != "":
-        profiles = await db.fetch(
-            """SELECT DISTINCT users.user_id, users.description FROM users 
-            INNER JOIN bot_owner ON users.user_id = bot_owner.owner 
-            INNER JOIN bots ON bot_owner.bot_id = bots.bot_id 
-            WHERE ((bots.state = 0 OR bots.state = 6) 
-            AND (bots.username_cached ilike $1 OR bots.description ilike $1 OR bots.bot_id::text ilike $1)) 
-            OR (users.username ilike $1) LIMIT 12""", 
-            f'%{q}%'
-        )
+        owner_ids = await profile_search(db, worker_session.redis, q)
+        descriptions = await db.fetch("SELECT user_id, description FROM users WHERE user_id = ANY($1::bigint[])", owner_ids)
+        descriptions = {row["user_id"]: row["description"] for row in descriptions}
+        profiles = [{"user_id": owner_id, "description": descriptions[owner_id]} for owner_id in owner_ids if owner_id in descriptions]
     else:
         profiles = []
     profile_obj = []
-    for profile in profiles:
-        profile_info = await get_user(profile["user_id"], worker_session = worker_session)
+    profile_infos = await get_users_many([profile["user_id"] for profile in profiles], worker_session = worker_session)
+    for profile, profile_info in zip(profiles, profile_infos):
         if profile_info:
             profile_obj.append({"banner": None, "description": profile["description"], "user": profile_info})
     if not api:
@@ -248,6 +233,6 @@ async def render_server(request: Request, guild_id: int, bt: BackgroundTasks, **
     guild_data = await db.fetchrow("SELECT description, long_description from servers WHERE guild_id = $1", guild_id)
     if not guild_data:
         return await templates.e(request, "Ask a server manager or admin to add this server to finish adding this server to our list!")
-    bt.add_task(add_ws_event, guild_id, {"m": {"e": enums.APIEvents.server_view}, "ctx": {"user": request.session.get('user_id'), "widget": False}}, type = "server")
+    event_buffer.add(guild_id, {"m": {"e": enums.APIEvents.server_view}, "ctx": {"user": request.session.get('user_id'), "widget": False}}, type = "server")
     data = {"data": guild_data | {"name": guild.name}, "type": "server", "id": guild_id, "tags_fixed": []} # TODO: Add tags, reviews and voting
     return await templates.TemplateResponse("bot_server.html", {"request": request, "replace_last": replace_last} | data)
@@ -1,31 +1,300 @@
+from typing import Callable
+
+from aioredis.exceptions import WatchError
+
 from .cache import *
 from .events import *
+from .helpers import bot_page_invalidate, decode_cursor, encode_cursor
 from .imports import *
 
 
-async def parse_reviews(worker_session, bot_id: int, rev_id: uuid.uuid4 = None, page: int = None, recache: bool = False, in_recache: bool = False) -> List[dict]:
-    if recache:
-        async def recache():
-            reviews = await _parse_reviews(worker_session, bot_id)
-            page_count = reviews[2]
-            for page in range(0, page_count):
-                await parse_reviews(worker_session, bot_id, page = page if page else None, in_recache = True)
-        asyncio.create_task(recache())
-        return
+REVIEW_CACHE_EXPIRY = 60*60*4
+REVIEW_MAX_DEPTH = 32
+
+review_columns = """id, reply, user_id, star_rating, review_text AS review, review_upvotes, 
+review_downvotes, flagged, epoch, replies AS _replies"""
+
+# Fetches root reviews (numbered by their position) and all their replies, at any depth
+review_tree_query = """
+WITH RECURSIVE roots AS (
+    SELECT id, row_number() OVER (ORDER BY epoch, star_rating ASC) AS pos FROM bot_reviews 
+    WHERE bot_id = $1 AND reply = $2 {rev_check}
+), tree AS (
+    SELECT bot_reviews.*, roots.pos, 0 AS depth FROM bot_reviews INNER JOIN roots ON roots.id = bot_reviews.id
+    UNION ALL
+    SELECT bot_reviews.*, tree.pos, tree.depth + 1 FROM tree 
+    INNER JOIN bot_reviews ON bot_reviews.id = ANY(tree.replies) AND bot_reviews.bot_id = $1 AND bot_reviews.reply = true
+    WHERE tree.depth < """ + str(REVIEW_MAX_DEPTH) + """
+)
+SELECT """ + review_columns + """, pos, depth FROM tree ORDER BY pos, depth
+"""
+
 
-    if not in_recache:
-        reviews = await worker_session.redis.get(f"botreview-{bot_id}-{page}")
+def _review_keys(bot_id: int) -> tuple:
+    """Review cache keys of a bot: reviews (review id -> review), root index (sorted by posting time) and aggregate"""
+    return f"fl:reviews:{bot_id}", f"fl:reviewidx:{bot_id}", f"fl:reviewstats:{bot_id}"
+
+
+def _review_version_key(bot_id: int) -> str:
+    """Review cache version of a bot, bumped on every review write so builds started before it are dropped"""
+    return f"fl:reviewver:{bot_id}"
+
+
+def _review_node(review, user: Optional[dict]) -> dict:
+    """Formats a review row for the API/template. Reply ids are kept in _replies"""
+    review = dict(review)
+    review.pop("pos", None)
+    review.pop("depth", None)
+    if review["epoch"] in ([], None):
+        review["epoch"] = [time.time()]
     else:
-        reviews = None
+        review["epoch"].sort(reverse = True)
+    review["time_past"] = str(time.time() - review["epoch"][0])
+    review["epoch"] = [str(ep) for ep in review["epoch"]]
+    review["id"] = str(review["id"])
+    review["user"] = user
+    review["user_id"] = str(review["user_id"])
+    review["star_rating"] = float(round(review["star_rating"], 2))
+    review["_replies"] = [str(reply) for reply in review["_replies"]]
+    review["review_upvotes"] = [str(ru) for ru in review["review_upvotes"]]
+    review["review_downvotes"] = [str(rd) for rd in review["review_downvotes"]]
+    return review
+
+
+async def _review_nodes(worker_session, rows) -> dict:
+    """Formats review rows (with all authors fetched in one batch) into review id -> review"""
+    users = await get_users_many([row["user_id"] for row in rows], worker_session = worker_session)
+    nodes = {}
+    for row, user in zip(rows, users):
+        if str(row["id"]) not in nodes:
+            nodes[str(row["id"])] = _review_node(row, user)
+    return nodes
 
-    if reviews:
-        return orjson.loads(reviews)
-    reviews = await _parse_reviews(worker_session, bot_id, rev_id = rev_id, page = page)
-    await worker_session.redis.set(f"botreview-{bot_id}-{page}", orjson.dumps(reviews), ex=60*60*4)
+
+def _review_tree(nodes: dict, root_ids: list, depth: int = 0) -> list:
+    """Assembles reviews with their replies (in the order of their parents replies array)"""
+    reviews = []
+    for review_id in root_ids:
+        if review_id not in nodes:
+            continue # Deleted or not loaded
+        review = dict(nodes[review_id])
+        replies = review.pop("_replies")
+        review["replies"] = _review_tree(nodes, replies, depth + 1) if depth < REVIEW_MAX_DEPTH else []
+        reviews.append(review)
     return reviews
 
 
-async def _parse_reviews(worker_session, bot_id: int, rev_id: uuid.uuid4 = None, page: int = None) -> List[dict]:
+def _review_score(review: dict) -> float:
+    """Position of a root review in the index (first posting time)"""
+    return min([float(ep) for ep in review["epoch"]], default = 0)
+
+
+REVIEW_STARS = 10
+
+# Applies a root review rating (delta is 1 when added and -1 when removed) to bot_review_stats
+review_stats_update_query = """
+UPDATE bot_review_stats SET count = count + $2::bigint, total = total + $2::bigint * $3::float8, 
+stars[LEAST(GREATEST(CEIL($3::float8), 1), 10)::int] = stars[LEAST(GREATEST(CEIL($3::float8), 1), 10)::int] + $2::bigint 
+WHERE bot_id = $1
+"""
+
+
+async def review_stats_update(conn, bot_id: int, *, add: Optional[float] = None, remove: Optional[float] = None):
+    """
+    Updates the review aggregate of a bot for a new (add) and/or removed (remove) root review rating. 
+    This must be called in the transaction writing the review
+    """
+    await conn.execute("INSERT INTO bot_review_stats (bot_id) VALUES ($1) ON CONFLICT (bot_id) DO NOTHING", bot_id)
+    if remove is not None:
+        await conn.execute(review_stats_update_query, bot_id, -1, remove)
+    if add is not None:
+        await conn.execute(review_stats_update_query, bot_id, 1, add)
+
+
+async def get_review_stats(db, bot_id: int) -> dict:
+    """Gets the review count, average rating and star histogram (1 to 10 stars) of a bot"""
+    stats = await db.fetchrow("SELECT count, total, stars FROM bot_review_stats WHERE bot_id = $1", bot_id)
+    if not stats or not stats["count"]:
+        return {"count": 0, "avg": 10.0, "stars": [0]*REVIEW_STARS}
+    return {"count": stats["count"], "avg": round(stats["total"]/stats["count"], 2), "stars": list(stats["stars"])}
+
+
+async def _review_cache_build(worker_session, bot_id: int):
+    """
+    Loads all reviews of a bot into the review cache. The cache is only written if no review 
+    was written since the build started (the version key is unchanged), otherwise the next read retries
+    """
+    db, redis = worker_session.postgres, worker_session.redis
+    reviews_key, index_key, stats_key = _review_keys(bot_id)
+    version_key = _review_version_key(bot_id)
+    version = await redis.get(version_key)
+    rows = await db.fetch(review_tree_query.format(rev_check = ""), bot_id, False)
+    nodes = await _review_nodes(worker_session, rows)
+    stats = await get_review_stats(db, bot_id)
+
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(version_key)
+            if await pipe.get(version_key) != version:
+                return # A write happened while we were reading, this data may be stale
+            pipe.multi()
+            pipe.delete(reviews_key, index_key)
+            if nodes:
+                pipe.hset(reviews_key, mapping = {review_id: orjson.dumps(node) for review_id, node in nodes.items()})
+                pipe.zadd(index_key, {str(row["id"]): _review_score(nodes[str(row["id"])]) for row in rows if row["depth"] == 0})
+            pipe.set(stats_key, orjson.dumps(stats), ex = REVIEW_CACHE_EXPIRY)
+            pipe.expire(reviews_key, REVIEW_CACHE_EXPIRY)
+            pipe.expire(index_key, REVIEW_CACHE_EXPIRY)
+            await pipe.execute()
+        except WatchError:
+            return
+
+
+async def _review_cache_write(redis, bot_id: int, write: Callable):
+    """
+    Applies write (which queues commands on a MULTI pipeline) to the review cache of a bot. 
+    Builds in progress are invalidated first. If there is no complete cache to apply the delta to 
+    (never built, expired or changed under us), the cache is dropped and rebuilt on the next read
+    """
+    reviews_key, index_key, stats_key = _review_keys(bot_id)
+    version_key = _review_version_key(bot_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.incr(version_key)
+        pipe.expire(version_key, REVIEW_CACHE_EXPIRY)
+        await pipe.execute()
+
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            await pipe.watch(reviews_key, index_key, stats_key)
+            if await pipe.exists(stats_key):
+                pipe.multi()
+                write(pipe)
+                pipe.expire(stats_key, REVIEW_CACHE_EXPIRY)
+                pipe.expire(reviews_key, REVIEW_CACHE_EXPIRY)
+                pipe.expire(index_key, REVIEW_CACHE_EXPIRY)
+                await pipe.execute()
+                return
+            await pipe.unwatch()
+        except WatchError:
+            pass
+    await redis.delete(reviews_key, index_key, stats_key)
+
+
+async def review_cache_update(worker_session, bot_id: int, *review_ids):
+    """
+    Reloads the given reviews (for example a new reply and the review it replies to) 
+    in the review cache and refreshes the aggregate
+    """
+    db, redis = worker_session.postgres, worker_session.redis
+    reviews_key, index_key, stats_key = _review_keys(bot_id)
+    await bot_page_invalidate(redis, bot_id)
+
+    rows = await db.fetch(f"SELECT {review_columns} FROM bot_reviews WHERE bot_id = $1 AND id = ANY($2::uuid[])", bot_id, list(review_ids))
+    nodes = await _review_nodes(worker_session, rows)
+    stats = await get_review_stats(db, bot_id)
+
+    def _write(pipe):
+        if nodes:
+            pipe.hset(reviews_key, mapping = {review_id: orjson.dumps(node) for review_id, node in nodes.items()})
+        roots = {review_id: _review_score(node) for review_id, node in nodes.items() if not node["reply"]}
+        if roots:
+            pipe.zadd(index_key, roots)
+        pipe.set(stats_key, orjson.dumps(stats), ex = REVIEW_CACHE_EXPIRY)
+
+    await _review_cache_write(redis, bot_id, _write)
+
+
+async def review_cache_delete(worker_session, bot_id: int, *review_ids):
+    """Removes deleted reviews from the review cache and refreshes the aggregate"""
+    db, redis = worker_session.postgres, worker_session.redis
+    reviews_key, index_key, stats_key = _review_keys(bot_id)
+    await bot_page_invalidate(redis, bot_id)
+
+    review_ids = [str(review_id) for review_id in review_ids]
+    stats = await get_review_stats(db, bot_id)
+
+    def _write(pipe):
+        pipe.hdel(reviews_key, *review_ids)
+        pipe.zrem(index_key, *review_ids)
+        pipe.set(stats_key, orjson.dumps(stats), ex = REVIEW_CACHE_EXPIRY)
+
+    await _review_cache_write(redis, bot_id, _write)
+
+
+async def parse_reviews(worker_session, bot_id: int, rev_id: uuid.uuid4 = None, page: int = None, recache: bool = False, after: str = None) -> List[dict]:
+    """
+    Gets a page of reviews (all if page is None) from the review cache. 
+    Pages are assembled from the root index and the per-review entries. Use recache to drop the cache.
+    after is the cursor (last element of the return value) of the previous page, None is returned if it is invalid
+    """
+    redis = worker_session.redis
+    reviews_key, index_key, stats_key = _review_keys(bot_id)
+    if recache:
+        await bot_page_invalidate(redis, bot_id)
+        await redis.incr(_review_version_key(bot_id))
+        await redis.expire(_review_version_key(bot_id), REVIEW_CACHE_EXPIRY)
+        await redis.delete(reviews_key, index_key, stats_key)
+        return
+
+    if rev_id:
+        return await _parse_reviews(worker_session, bot_id, rev_id = rev_id)
+
+    per_page = 9
+    if after:
+        # (score, review id) of the last review of the previous page, the id breaks ties between equal scores
+        after = decode_cursor(after)
+        if not after or len(after) != 2 or not isinstance(after[0], float) or not isinstance(after[1], str):
+            return None
+    start, stop = (per_page*(page-1), per_page*page) if page else (0, -1) # One extra review to know if there is a next page
+    for _ in range(2):
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.get(stats_key)
+            if after:
+                pipe.zcount(index_key, after[0], after[0])
+            else:
+                pipe.zrange(index_key, start, stop, withscores = True)
+            stats, root_ids = await pipe.execute()
+        if stats:
+            break
+        await _review_cache_build(worker_session, bot_id)
+    stats = orjson.loads(stats) if stats else await get_review_stats(worker_session.postgres, bot_id)
+
+    if after:
+        # Members with equal scores are ordered by id, skip those up to the cursor
+        root_ids = await redis.zrangebyscore(index_key, after[0], "+inf", start = 0, num = per_page + 1 + root_ids, withscores = True)
+        root_ids = [(review_id, score) for review_id, score in root_ids if score > after[0] or review_id.decode("utf-8") > after[1]]
+
+    cursor = None
+    if (page or after) and len(root_ids) > per_page:
+        root_ids = root_ids[:per_page]
+        cursor = encode_cursor(root_ids[-1][1], root_ids[-1][0].decode("utf-8"))
+
+    # Load the roots and then their replies, one level at a time
+    nodes = {}
+    pending = [review_id.decode("utf-8") for review_id, _ in root_ids]
+    root_ids = list(pending)
+    for _ in range(REVIEW_MAX_DEPTH + 1):
+        if not pending:
+            break
+        fetched = await redis.hmget(reviews_key, pending)
+        pending = []
+        for node in fetched:
+            if node:
+                node = orjson.loads(node)
+                nodes[node["id"]] = node
+                pending += [reply_id for reply_id in node["_replies"] if reply_id not in nodes]
+
+    reviews = _review_tree(nodes, root_ids)
+    if not reviews:
+        return reviews, 10.0, 0, 0, per_page, stats, None
+    return reviews, stats["avg"], stats["count"], int(math.ceil(stats["count"]/per_page)), per_page, stats, cursor
+
+
+async def _parse_reviews(worker_session, bot_id: int, rev_id: uuid.uuid4 = None) -> List[dict]:
+    """
+    Loads reviews (or a single reply if rev_id is set) with all their replies using one recursive query, 
+    one batched author fetch and one aggregate query
+    """
     db = worker_session.postgres
 
     per_page = 9
@@ -38,42 +307,12 @@ async def _parse_reviews(worker_session, bot_id: int, rev_id: uuid.uuid4 = None,
         rev_check = "AND id = $3" # Extra string to check for review id
         rev_args = (rev_id,) # Extra argument of review id
 
-    if page is None:
-        end = ""
-    else:
-        end = f"OFFSET {per_page*(page-1)} LIMIT {per_page}"
-    reviews = await db.fetch(f"SELECT id, reply, user_id, star_rating, review_text AS review, review_upvotes, review_downvotes, flagged, epoch, replies AS _replies FROM bot_reviews WHERE bot_id = $1 AND reply = $2 {rev_check} ORDER BY epoch, star_rating ASC {end}", bot_id, reply, *rev_args)
-    i = 0
-    stars = 0
-    while i < len(reviews):
-        reviews[i] = dict(reviews[i])
-        if reviews[i]["epoch"] in ([], None):
-            reviews[i]["epoch"] = [time.time()]
-        else:
-            reviews[i]["epoch"].sort(reverse = True)
-        reviews[i]["time_past"] = str(time.time() - reviews[i]["epoch"][0])
-        reviews[i]["epoch"] = [str(ep) for ep in reviews[i]["epoch"]]
-        reviews[i]["id"] = str(reviews[i]["id"])
-        reviews[i]["user"] = await get_user(reviews[i]["user_id"], worker_session = worker_session)
-        reviews[i]["user_id"] = str(reviews[i]["user_id"])
-        reviews[i]["star_rating"] = float(round(reviews[i]["star_rating"], 2))
-        reviews[i]["replies"] = []
-        reviews[i]["review_upvotes"] = [str(ru) for ru in reviews[i]["review_upvotes"]]
-        reviews[i]["review_downvotes"] = [str(rd) for rd in reviews[i]["review_downvotes"]]
-        if not rev_id:
-            stars += reviews[i]["star_rating"]
-        for review_id in reviews[i]["_replies"]:
-            _parsed_reply = await _parse_reviews(worker_session, bot_id, review_id)
-            try:
-                reviews[i]["replies"].append(_parsed_reply[0][0])
-            except:
-                pass
-        del reviews[i]["_replies"]
-        i+=1
-    total_rev = await db.fetchrow("SELECT COUNT(1) AS count, AVG(star_rating)::numeric(10, 2) AS avg FROM bot_reviews WHERE bot_id = $1 AND reply = false", bot_id)
-
-    if i == 0:
-        return reviews, 10.0, 0, 0, per_page
-    logger.trace(f"Total reviews per page is {total_rev['count']/per_page}")
-    return reviews, float(total_rev["avg"]), int(total_rev["count"]), int(math.ceil(total_rev["count"]/per_page)), per_page
+    rows = await db.fetch(review_tree_query.format(rev_check = rev_check), bot_id, reply, *rev_args)
+    nodes = await _review_nodes(worker_session, rows)
+    reviews = _review_tree(nodes, [str(row["id"]) for row in rows if row["depth"] == 0])
 
+    stats = await get_review_stats(db, bot_id)
+    if not reviews:
+        return reviews, 10.0, 0, 0, per_page, stats, None
+    logger.trace(f"Total reviews per page is {stats['count']/per_page}")
+    return reviews, stats["avg"], stats["count"], int(math.ceil(stats["count"]/per_page)), per_page, stats, None
@@ -0,0 +1,52 @@
+"""
+Streaming (NDJSON) responses for large listings. Rows are read in keyset pages
+and sent in chunks as they are hydrated so memory stays bounded. No connection 
+or transaction is held while a chunk is being sent to the client
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from starlette.responses import StreamingResponse
+
+from .imports import *
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_SIZE = 100
+
+
+def wants_ndjson(request: Request, stream: bool = False) -> bool:
+    """Whether a streaming response was asked for (stream query flag or Accept: application/x-ndjson)"""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("Accept", "")
+
+
+async def stream_query(
+    worker_session,
+    query: str,
+    *args,
+    key: Callable[[Any], tuple],
+    after: tuple,
+    hydrate: Optional[Callable[[list], Awaitable[list]]] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE
+) -> AsyncIterator[list]:
+    """
+    Iterates a keyset query page by page, yielding chunks of rows (hydrated by hydrate if given). 
+    The query is called with args, then the key of the last row read (after for the first page) and then the page size. 
+    key gives the key (in query order) of a row
+    """
+    while True:
+        rows = await worker_session.postgres.fetch(query, *args, *after, chunk_size)
+        if rows:
+            yield await hydrate(rows) if hydrate else rows
+        if len(rows) < chunk_size:
+            return
+        after = key(rows[-1])
+
+
+def ndjson_response(*chunks: AsyncIterator[list]) -> StreamingResponse:
+    """Streams chunks of objects (from one or more iterators, in order) as NDJSON, one object per line"""
+    async def _stream():
+        for _chunks in chunks:
+            async for chunk in _chunks:
+                if chunk:
+                    yield b"".join(orjson.dumps(obj) + b"\n" for obj in chunk)
+    return StreamingResponse(_stream(), media_type = NDJSON_MEDIA_TYPE)
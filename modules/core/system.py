@@ -9,6 +9,7 @@ import signal
 import sys
 import time
 import uuid
+from collections import Counter
 from http import HTTPStatus
 
 import aioredis
@@ -19,7 +20,6 @@ from fastapi.exceptions import (HTTPException, RequestValidationError,
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from lynxfall.core.classes import Singleton
 from lynxfall.oauth.models import OauthConfig
 from lynxfall.oauth.providers.discord import DiscordOauth
@@ -37,6 +37,7 @@ from config._logger import logger
 from modules.core.error import WebError
 from modules.core.ipc import redis_ipc_new
 from modules.core.ratelimits import rl_key_func
+from modules.core.templating import create_templates
 from modules.models import enums
 
 sys.pycache_prefix = "data/pycache"
@@ -187,9 +188,16 @@ class FatesWorkerSession(Singleton):  # pylint: disable=too-many-instance-attrib
         
         # Used in shutdown to check if already dead
         self.dying = False
+
+        # Pending index snapshot refresh reasons (primary worker only)
+        self.index_refresh = set()
+        self.index_refresh_event = asyncio.Event()
         
-        # Templating
-        self.templates = Jinja2Templates(directory="data/templates")
+        # Templating (precompiled, see templating.create_templates)
+        self.templates = create_templates()
+
+        # Background tasks of the primary worker by name (see start_task)
+        self.tasks = {}
 
     def set_up(self):
         """Set the worker to up"""
@@ -205,6 +213,13 @@ class FatesWorkerSession(Singleton):  # pylint: disable=too-many-instance-attrib
         """Returns if we are primary (first) worker"""
         return self.fup and self.workers[0] == os.getpid()
 
+    def start_task(self, name: str, func):
+        """Starts a background task func(session) unless a task with this name is still running"""
+        task = self.tasks.get(name)
+        if task and not task.done():
+            return
+        self.tasks[name] = asyncio.create_task(func(self))
+
     def get_worker_index(self):
         """
         This function should only be called 
@@ -452,7 +467,38 @@ async def catclient(workers, session):
                         f"Got invalid workers from ipc ({workers})"
                     )
                
-                asyncio.create_task(vote_reminder(session))
+                # FUP is sent again on REGET, tasks which are still running are not started twice
+                session.start_task("vote_reminder", vote_reminder)
+                session.start_task("index_snapshotter", index_snapshotter)
+                session.start_task("profile_search_indexer", profile_search_indexer)
+                session.start_task("vote_applier", vote_applier)
+
+            # Something on the index changed (votes, approvals etc.)
+            case("INDEXREFRESH", reason):
+                if session.primary_worker():
+                    session.index_refresh.add(reason)
+                    session.index_refresh_event.set()
+
+            # A user cache entry was rewritten by another worker
+            case("CACHEINV", pid, *user_ids):
+                if pid == str(os.getpid()):
+                    continue
+                cache = importlib.import_module("modules.core.cache")
+                cache.user_l1.invalidate(*user_ids)
+
+            # A bot or user token was regenerated or removed
+            case("TOKENINV", pid, kind, id):
+                if pid == str(os.getpid()):
+                    continue
+                auth = importlib.import_module("modules.core.auth")
+                auth.token_cache.invalidate(kind, int(id))
+
+            # A users ban state, token or preferences changed
+            case("USERCTXINV", pid, user_id):
+                if pid == str(os.getpid()):
+                    continue
+                templating = importlib.import_module("modules.core.templating")
+                templating.user_ctx_cache.invalidate(int(user_id))
 
             case _:
                 pass  # Ignore the rest for now
@@ -487,6 +533,136 @@ async def vote_reminder(session):
         await vote_reminder(session)
 
 
+async def index_snapshotter(session):
+    """
+    Index snapshot task. Rebuilds the index snapshot every INDEX_SNAPSHOT_INTERVAL
+    seconds and on INDEXREFRESH (only the affected sections where possible)
+    """
+    if not session.primary_worker():
+        return
+    helpers = importlib.import_module("modules.core.helpers")
+    sections = None
+    while not session.dying and session.primary_worker():
+        try:
+            await helpers.build_index_snapshot(session, sections)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to build index snapshot")
+
+        try:
+            await asyncio.wait_for(
+                session.index_refresh_event.wait(), 
+                timeout=helpers.INDEX_SNAPSHOT_INTERVAL
+            )
+        except asyncio.TimeoutError:
+            sections = None
+            continue
+        
+        # Let bursts of votes settle before refreshing
+        await asyncio.sleep(2)
+        reasons, session.index_refresh = session.index_refresh, set()
+        session.index_refresh_event.clear()
+
+        sections = set()
+        for reason in reasons:
+            if reason not in helpers.index_refresh_sections:
+                sections = None
+                break
+            sections.update(helpers.index_refresh_sections[reason])
+        sections = tuple(sections) if sections else None
+
+
+async def profile_search_indexer(session):
+    """
+    Rebuilds the profile search index every 30 minutes to pick up bot 
+    state and username changes (ownership changes update it directly)
+    """
+    if not session.primary_worker():
+        return
+    helpers = importlib.import_module("modules.core.helpers")
+    while not session.dying and session.primary_worker():
+        try:
+            await helpers.profile_search_index(session.postgres, session.redis)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to build profile search index")
+        await asyncio.sleep(60 * 30)
+
+
+async def vote_applier(session):
+    """
+    Applies queued votes from the vote stream in batches. Votes left pending 
+    (by a previous primary worker or a failed batch) are applied first. If a batch fails, 
+    its votes are retried one by one and votes which keep failing are moved to the dead letter stream
+    """
+    if not session.primary_worker():
+        return
+    helpers = importlib.import_module("modules.core.helpers")
+    redis = session.redis
+    try:
+        await redis.xgroup_create(helpers.VOTE_STREAM_KEY, helpers.VOTE_STREAM_GROUP, id="0", mkstream=True)
+    except aioredis.exceptions.ResponseError:
+        pass  # Group already exists
+
+    async def _done(ids):
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.xack(helpers.VOTE_STREAM_KEY, helpers.VOTE_STREAM_GROUP, *ids)
+            pipe.xdel(helpers.VOTE_STREAM_KEY, *ids)
+            await pipe.execute()
+
+    failures = Counter()  # Entry id -> failed attempts
+    last_id = "0"  # Pending votes first, then new ones (>)
+    pruned = 0
+    while not session.dying and session.primary_worker():
+        try:
+            if time.time() - pruned > 60 * 60:
+                # Applied entry ids are only needed while the entries can still be redelivered
+                await session.postgres.execute(
+                    "DELETE FROM vote_entries WHERE applied_at < NOW() - make_interval(secs => $1)",
+                    helpers.VOTE_ENTRY_RETENTION
+                )
+                pruned = time.time()
+
+            streams = await redis.xreadgroup(
+                helpers.VOTE_STREAM_GROUP,
+                "primary",
+                {helpers.VOTE_STREAM_KEY: last_id},
+                count=helpers.VOTE_BATCH_SIZE,
+                block=1000
+            )
+            entries = streams[0][1] if streams else []
+            if not entries:
+                last_id = ">"
+                continue
+
+            try:
+                bots = await helpers.apply_votes(session.postgres, redis, entries)
+                await _done([entry_id for entry_id, _ in entries])
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to apply vote batch, retrying votes one by one")
+                bots, failed = [], False
+                for entry_id, vote in entries:
+                    try:
+                        bots += await helpers.apply_votes(session.postgres, redis, [(entry_id, vote)])
+                    except Exception as exc:  # pylint: disable=broad-except
+                        failures[entry_id] += 1
+                        if failures[entry_id] < helpers.VOTE_MAX_ATTEMPTS:
+                            failed = True
+                            continue
+                        logger.error(f"Moving vote {entry_id} to the dead letter stream: {exc}")
+                        await redis.xadd(helpers.VOTE_DEAD_STREAM_KEY, vote | {b"id": entry_id, b"error": str(exc)})
+                    failures.pop(entry_id, None)
+                    await _done([entry_id])
+                last_id = "0"  # Retry the failed votes which are still pending
+                if failed:
+                    await asyncio.sleep(5)
+
+            if bots:
+                await helpers.request_index_refresh(redis, "vote")
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to apply votes")
+            last_id = "0"
+            await asyncio.sleep(5)
+
+
 def calc_tags(list_tags):
     """Calculate bot list tags"""
     # Tag calculation
@@ -518,6 +694,7 @@ def shutdown_fates_worker(app):
 
     async def _close():
         await asyncio.sleep(0)
+        await importlib.import_module("modules.core.events").event_buffer.flush()
         await db.close()
         await redis.publish("_worker", f"DOWN WORKER {os.getpid()}")
         await redis.close()
@@ -2,10 +2,96 @@
 Fates List Templating System
 """
 
+import os
+from collections import OrderedDict
+from pathlib import Path
+
 import markdown
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 
 from .imports import *
 
+TEMPLATE_DIR = "data/templates"
+TEMPLATE_CACHE_DIR = "data/pycache/jinja" # Compiled template bytecode, shared by all workers
+
+
+def _md(s: str) -> str:
+    return emd(markdown.markdown(s, extensions = md_extensions))
+
+
+def create_templates() -> Jinja2Templates:
+    """
+    Creates the templates of a worker. Helpers used by all templates are registered as 
+    environment globals once and all templates are compiled at boot (using the bytecode cache)
+    """
+    Path(TEMPLATE_CACHE_DIR).mkdir(parents = True, exist_ok = True)
+    _templates = Jinja2Templates(directory = TEMPLATE_DIR)
+    env = _templates.env
+    env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    env.globals |= {
+        "site_url": site_url,
+        "enums": enums,
+        "len": len,
+        "ireplace": ireplace,
+        "ireplacem": ireplacem,
+        "human_format": human_format,
+        "intl_text": intl_text, # This comes from lynxfall.utils.string
+        "md": _md
+    }
+    for name in env.list_templates(extensions = ["html"]):
+        env.get_template(name)
+    return _templates
+
+
+class UserContextCache():
+    """Per-worker cache of the user row fields the base template needs (ban state, token and preferences)"""
+    def __init__(self, maxsize: int = 5000, ttl: int = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict() # User id -> (time added, context)
+
+    def get(self, user_id: int) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    def set(self, user_id: int, ctx: dict):
+        self._entries[user_id] = (time.time(), ctx)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last = False)
+
+    def invalidate(self, *user_ids: int):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+
+user_ctx_cache = UserContextCache()
+
+
+async def get_user_context(db, user_id: int) -> Optional[dict]:
+    """Gets the cached template context of a user, None if the user does not exist"""
+    ctx = user_ctx_cache.get(user_id)
+    if ctx is not None:
+        return ctx
+    row = await db.fetchrow("SELECT state, api_token, js_allowed, css, site_lang FROM users WHERE user_id = $1", user_id)
+    if row is None:
+        return None
+    ctx = dict(row)
+    user_ctx_cache.set(user_id, ctx)
+    return ctx
+
+
+async def user_context_invalidate(redis, user_id: int):
+    """Drops the cached template context of a user on all workers (USERCTXINV <PID> <USER ID>)"""
+    user_ctx_cache.invalidate(int(user_id))
+    await redis.publish("_worker_fates", f"USERCTXINV {os.getpid()} {user_id}")
+
 
 # Template class renderer
 class templates():
@@ -16,8 +102,9 @@ class templates():
         db = worker_session.postgres
         status = arg_dict.get("status_code")
         if "user_id" in request.session.keys():
-            arg_dict["css"] = request.session.get("user_css")
-            state = await db.fetchval("SELECT state FROM users WHERE user_id = $1", int(request.session["user_id"]))
+            user_ctx = await get_user_context(db, int(request.session["user_id"])) or {}
+            arg_dict["css"] = user_ctx.get("css") or request.session.get("user_css")
+            state = user_ctx.get("state")
             if (state == enums.UserState.global_ban) and not_error:
                 ban_type = enums.UserState(state).__doc__
                 return await templates.e(request, f"You have been {ban_type} banned from Fates List<br/>", status_code = 403)
@@ -25,21 +112,13 @@ class templates():
             arg_dict["avatar"] = request.session.get("avatar")
             arg_dict["username"] = request.session.get("username")
             arg_dict["user_id"] = int(request.session.get("user_id"))
-            if request.session.get("user_id"):
-                arg_dict["user_token"] = await db.fetchval("SELECT api_token FROM users WHERE user_id = $1", arg_dict["user_id"]) 
-            arg_dict["intl_text"] = intl_text # This comes from lynxfall.utils.string
-            arg_dict["site_lang"] = request.session.get("site_lang", "default")
+            arg_dict["user_token"] = user_ctx.get("api_token")
+            arg_dict["site_lang"] = request.session.get("site_lang") or user_ctx.get("site_lang") or "default"
             arg_dict["scopes"] = request.session.get("scopes")
         else:
             arg_dict["staff"] = [False]
-        arg_dict["site_url"] = site_url
         arg_dict["data"] = arg_dict.get("data")
         arg_dict["path"] = request.url.path
-        arg_dict["enums"] = enums
-        arg_dict["len"] = len
-        arg_dict["ireplace"] = ireplace
-        arg_dict["ireplacem"] = ireplacem
-        arg_dict["human_format"] = human_format
 
         base_context = {
             "user_id": str(arg_dict["user_id"]) if "user_id" in arg_dict.keys() else None,
@@ -49,7 +128,6 @@ class templates():
         }
         
         arg_dict["context"] = base_context | context
-        arg_dict["md"] = lambda s: emd(markdown.markdown(s, extensions = md_extensions))        
         _templates = worker_session.templates
         
         if status is None:
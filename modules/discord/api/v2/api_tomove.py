@@ -49,10 +49,10 @@ async def get_index(request: Request, t: Optional[str] = "bots", cert: Optional[
         )
     ]
 )
-async def search_list(request: Request, q: str, t: Optional[str] = "bots"):
-    """For any potential Android/iOS app, crawlers etc. Q is the query to search for. T is either bots or profiles"""
+async def search_list(request: Request, q: str, t: Optional[str] = "bots", page: Optional[int] = 1):
+    """For any potential Android/iOS app, crawlers etc. Q is the query to search for. T is either bots or profiles. Page is only supported for bots"""
     if t == "bots":
-        return await render_search(request = request, q = q, api = True)
+        return await render_search(request = request, q = q, api = True, page = page)
     elif t == "profiles":
         return await render_profile_search(request = request, q = q, api = True)
     return abort(404)
@@ -63,6 +63,7 @@ async def login_user(request: Request, data: Login, worker_session = Depends(wor
             userjson["username"], 
             token
         )
+        await profile_search_index(db, redis_db, [int(userjson["id"])])
 
         css, state, js_allowed, site_lang = None, 0, True, "default"
 
@@ -82,9 +83,11 @@ async def login_user(request: Request, data: Login, worker_session = Depends(wor
             )
         if userjson["username"] != user_info["username"]:
             await db.execute(
-                "UPDATE users SET username = $1", 
-                userjson["username"]
+                "UPDATE users SET username = $1 WHERE user_id = $2", 
+                userjson["username"],
+                int(userjson["id"])
             ) 
+            await profile_search_index(db, redis_db, [int(userjson["id"])])
 
         token, css, state, js_allowed, site_lang = user_info["api_token"], user_info["css"] if user_info["css"] else None, state, user_info["js_allowed"], user_info["site_lang"]
 
@@ -105,6 +108,7 @@ async def login_user(request: Request, data: Login, worker_session = Depends(wor
     request.session["username"], request.session["avatar"] = userjson["username"], avatar
     request.session["user_token"], request.session["user_css"] = token, css
     request.session["js_allowed"], request.session["site_lang"] = js_allowed, site_lang
+    user_ctx_cache.invalidate(int(userjson["id"])) # Refill the template context for the new session
 
     return api_success(
         user = BaseUser(
@@ -36,10 +36,12 @@ def is_color_like(c):
 
 @router.get("/{bot_id}/vpm")
 async def get_votes_per_month(request: Request, bot_id: int):
-    return await db.fetch("SELECT votes, epoch FROM bot_stats_votes_pm WHERE bot_id = $1", bot_id)
+    """Gets the votes of a bot per month (YYYYMM) as rolled up by the vote stream"""
+    return await db.fetch("SELECT month, votes FROM bot_stats_votes_pm WHERE bot_id = $1 ORDER BY month", bot_id)
 
 @router.get("/{bot_id}/tv")
 async def get_total_votes(request: Request, bot_id: int):
+    """Gets the total votes of a bot as rolled up by the vote stream"""
     return await db.fetchrow("SELECT total_votes AS votes FROM bot_stats_votes WHERE bot_id = $1", bot_id)
 
 @router.patch(
@@ -75,6 +77,7 @@ async def regenerate_bot_token(request: Request, bot_id: int):
     ```
     """
     await db.execute("UPDATE bots SET api_token = $1 WHERE bot_id = $2", get_token(132), bot_id)
+    await token_cache_invalidate(redis_db, "bot", bot_id)
     return api_success()
 
 @router.get(
@@ -162,70 +165,40 @@ async def fetch_bot(
     if len(str(bot_id)) not in [17, 18, 19, 20]:
         return abort(404)
 
+    worker_session = request.app.state.worker_session
     if not no_cache:
-        cache = await redis_db.get(f"botcache-{bot_id}")
+        cache = await worker_session.redis.get(f"botcache-{bot_id}")
         if cache:
             return orjson.loads(cache)
     
 
-    api_ret = await db.fetchrow(
-        "SELECT last_stats_post, banner_card, banner_page, guild_count, shard_count, shards, prefix, invite, invite_amount, features, bot_library AS library, state, website, discord AS support, github, user_count, votes, donate, privacy_policy, nsfw FROM bots WHERE bot_id = $1", 
-        bot_id
-    )
-    if api_ret is None:
+    # Owners and the bot user are fetched concurrently in one batch (see load_bot)
+    bot = await load_bot(worker_session, bot_id, users = not offline)
+    if bot is None:
         return abort(404)
 
-    api_ret = dict(api_ret)
+    api_ret = {key: bot[key] for key in (
+        "last_stats_post", "banner_card", "banner_page", "guild_count", "shard_count", "shards", "prefix", 
+        "invite", "invite_amount", "features", "library", "state", "website", "support", "github", 
+        "user_count", "votes", "donate", "privacy_policy", "nsfw", "tags", "vanity"
+    )}
 
     if not compact:
-        extra = await db.fetchrow(
-            "SELECT description, long_description_type, long_description, css, keep_banner_decor FROM bots WHERE bot_id = $1",
-            bot_id
-        )
-        api_ret |= dict(extra)
-
-    tags = await db.fetch("SELECT tag FROM bot_tags WHERE bot_id = $1", bot_id)
-    api_ret["tags"] = [tag["tag"] for tag in tags]
+        api_ret |= {key: bot[key] for key in ("description", "long_description_type", "long_description", "css", "keep_banner_decor")}
    
     if not offline:
-        owners_db = await db.fetch("SELECT owner, main FROM bot_owner WHERE bot_id = $1", bot_id)
-        owners = []
-        _done = []
-
-        # Preperly sort owners
-        for owner in owners_db:
-            if owner in _done: continue
-        
-            _done.append(owner["owner"])
-            user = await get_user(owner["owner"])
-            main = owner["main"]
-
-            if not user: continue
-        
-            owner_obj = {
-                "user": user,
-                "main": main
-            }
-        
-            if main: owners.insert(0, owner_obj)
-            else: owners.append(owner_obj)
-
-        api_ret["owners"] = owners
+        api_ret["owners"] = bot["owners"]
     
-    api_ret["features"] = api_ret["features"]
-    api_ret["invite_link"] = await invite_bot(bot_id, api = True)
+    api_ret["invite_link"] = bot_invite_url(bot_id, bot["invite"])
+    if bot["invite"] and not bot["invite"].startswith("P:"):
+        event_buffer.add(bot_id, {"m": {"e": enums.APIEvents.bot_invite}, "ctx": {"user": "None", "api": True}})
     
     if not offline:
-        api_ret["user"] = await get_bot(bot_id)
+        api_ret["user"] = bot["user"]
         if not api_ret["user"]:
             return abort(404)
-    
-    api_ret["vanity"] = await db.fetchval(
-        "SELECT vanity_url FROM vanity WHERE redirect = $1", 
-        bot_id
-    )
 
-    await redis_db.set(f"botcache-{bot_id}", orjson.dumps(api_ret), ex=60*60*8)
+    await worker_session.redis.set(f"botcache-{bot_id}", orjson.dumps(api_ret), ex=60*60*8)
 
     return api_ret
 
@@ -259,7 +232,7 @@ async def bot_widget(request: Request, bt: BackgroundTasks, bot_id: int, format:
     if not bot:
         return abort(404)
     
-    bt.add_task(add_ws_event, bot_id, {"m": {"e": enums.APIEvents.bot_view}, "ctx": {"user": request.session.get('user_id'), "widget": True}})
+    event_buffer.add(bot_id, {"m": {"e": enums.APIEvents.bot_view}, "ctx": {"user": request.session.get('user_id'), "widget": True}})
     data = {"bot": bot, "user": await get_bot(bot_id, worker_session = request.app.state.worker_session)}
     bot_obj = data["user"]
     
@@ -446,12 +419,22 @@ async def get_bot_events(request: Request, bot_id: int, exclude: Optional[str] =
     ],
     operation_id="get_bot_ws_events"
 )
-async def get_bot_ws_events(request: Request, bot_id: int):
-    ini_events = {}
-    events = await redis_db.hget(f"{type}-{bot_id}", key = "ws")
+async def get_bot_ws_events(
+    request: Request, 
+    bot_id: int, 
+    after: Optional[str] = None, 
+    before: Optional[str] = None, 
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Gets the websocket events of a bot, oldest first. 
+
+    after and before are cursors (exclusive). Pass the returned cursor as after to get the next page of events
+    """
+    events = await get_ws_events(bot_id, after = after, before = before, limit = limit)
     if events is None:
-        events = {} # Nothing
-    return events 
+        return api_error("Invalid cursor")
+    return events
     
 
 @router.post(
@@ -100,6 +100,8 @@ class BaseSearch(BaseModel):
 class BotSearch(BaseSearch):
     search_res: list
     profile_search: bool 
+    page: Optional[int] = None
+    per_page: Optional[int] = None
 
 class ProfilePartial(BaseUser):
     description: Optional[str] = None
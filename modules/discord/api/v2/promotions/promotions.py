@@ -55,6 +55,7 @@ async def edit_promotion(request: Request, bot_id: int, promo: BotPromotion, id:
         bot_id, 
         id
     )
+    await bot_page_invalidate(redis_db, bot_id)
     return api_success()
 
 @router.delete(
@@ -73,4 +74,5 @@ async def delete_promotion(request: Request, bot_id: int, id: uuid.UUID):
             status_code = 404
         )
     await db.execute("DELETE FROM bot_promotions WHERE bot_id = $1 AND id = $2", bot_id, id)
+    await bot_page_invalidate(redis_db, bot_id)
     return api_success()
@@ -46,6 +46,8 @@ class BotReviews(BaseModel):
     """Represents bot reviews and average stars of a bot on Fates List"""
     reviews: BotReviewList
     average_stars: float
+    star_histogram: List[int] # Number of reviews with 1 to 10 stars (ratings are rounded up)
+    cursor: Optional[str] = None # Cursor of the next page
     pager: BasePager
 
 BotReview.update_forward_refs()
@@ -19,13 +19,18 @@ minlength = 10
         Depends(id_check("bot"))
     ]
 )
-async def get_bot_reviews(request: Request, bot_id: int, page: Optional[int] = 1):
-    reviews = await parse_reviews(request.app.state.worker_session, bot_id, page = page)
+async def get_bot_reviews(request: Request, bot_id: int, page: Optional[int] = 1, after: Optional[str] = None):
+    """Pass the returned cursor as after to get the next page (instead of page), cursor is null on the last page"""
+    reviews = await parse_reviews(request.app.state.worker_session, bot_id, page = page, after = after)
+    if reviews is None:
+        return api_error("Invalid cursor")
     if reviews[0] == []:
         return abort(404)
     return {
         "reviews": reviews[0],
         "average_stars": reviews[1],
+        "star_histogram": reviews[5]["stars"],
+        "cursor": reviews[6],
         "pager": {
             "total_count": reviews[2], 
             "total_pages": reviews[3], 
@@ -68,19 +73,23 @@ async def new_review(request: Request, user_id: int, bot_id: int, data: BotRevie
             return abort(404)
         
     id = uuid.uuid4()
-    await db.execute(
-        "INSERT INTO bot_reviews (id, bot_id, user_id, star_rating, review_text, epoch, reply) VALUES ($1, $2, $3, $4, $5, $6, $7)",
-        id,
-        bot_id, 
-        user_id,
-        data.star_rating, 
-        data.review, 
-        [time.time()],
-        data.reply
-    )
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "INSERT INTO bot_reviews (id, bot_id, user_id, star_rating, review_text, epoch, reply) VALUES ($1, $2, $3, $4, $5, $6, $7)",
+                id,
+                bot_id, 
+                user_id,
+                data.star_rating, 
+                data.review, 
+                [time.time()],
+                data.reply
+            )
     
-    if data.reply:
-        await db.execute("UPDATE bot_reviews SET replies = replies || $1 WHERE id = $2", [id], data.id)
+            if data.reply:
+                await conn.execute("UPDATE bot_reviews SET replies = replies || $1 WHERE id = $2", [id], data.id)
+            else:
+                await review_stats_update(conn, bot_id, add = data.star_rating)
         
     await bot_add_event(
         bot_id, 
@@ -95,12 +104,8 @@ async def new_review(request: Request, user_id: int, bot_id: int, data: BotRevie
         }
     )
 
-    # Recache reviews
-    await parse_reviews(
-        request.app.state.worker_session, 
-        bot_id, 
-        recache = True
-    )
+    # Update the cached review (and the review replied to)
+    await review_cache_update(request.app.state.worker_session, bot_id, id, *([data.id] if data.reply else []))
 
     return api_success()
 
@@ -121,23 +126,27 @@ async def edit_review(request: Request, user_id: int, bot_id: int, id: uuid.UUID
             f"Reviews must be at least {minlength} characters long"
         )
 
-    check = await db.fetchrow(
-        "SELECT COUNT(1) FROM bot_reviews WHERE id = $1 AND bot_id = $2 AND user_id = $3", 
-        id,
-        bot_id, 
-        user_id
-    )
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            check = await conn.fetchrow(
+                "SELECT reply, star_rating FROM bot_reviews WHERE id = $1 AND bot_id = $2 AND user_id = $3 FOR UPDATE", 
+                id,
+                bot_id, 
+                user_id
+            )
         
-    if not check:       
-        return abort(404)
+            if not check:       
+                return abort(404)
         
-    await db.execute(
-        "UPDATE bot_reviews SET star_rating = $1, review_text = $2, epoch = epoch || $3 WHERE id = $4", 
-        data.star_rating, 
-        data.review, 
-        [time.time()],
-        id
-    )
+            await conn.execute(
+                "UPDATE bot_reviews SET star_rating = $1, review_text = $2, epoch = epoch || $3 WHERE id = $4", 
+                data.star_rating, 
+                data.review, 
+                [time.time()],
+                id
+            )
+            if not check["reply"]:
+                await review_stats_update(conn, bot_id, add = data.star_rating, remove = check["star_rating"])
 
     await bot_add_event(
         bot_id, 
@@ -150,12 +159,8 @@ async def edit_review(request: Request, user_id: int, bot_id: int, id: uuid.UUID
         }
     )
 
-    # Recache reviews
-    await parse_reviews(
-        request.app.state.worker_session, 
-        bot_id, 
-        recache = True
-    )
+    # Update the cached review
+    await review_cache_update(request.app.state.worker_session, bot_id, id)
 
     return api_success()
     
@@ -170,19 +175,22 @@ async def edit_review(request: Request, user_id: int, bot_id: int, id: uuid.UUID
     ]
 )
 async def delete_review(request: Request, user_id: int, bot_id: int, id: uuid.UUID):
-    check = await db.fetchrow(
-        "SELECT reply, replies FROM bot_reviews WHERE id = $1 AND bot_id = $2 AND user_id = $3", 
-        id, 
-        bot_id, 
-        user_id
-    )
+    async with db.acquire() as conn:
+        async with conn.transaction():
+            check = await conn.fetchrow(
+                "SELECT reply, replies, star_rating FROM bot_reviews WHERE id = $1 AND bot_id = $2 AND user_id = $3 FOR UPDATE", 
+                id, 
+                bot_id, 
+                user_id
+            )
     
-    if check is None:
-        return abort(404)
+            if check is None:
+                return abort(404)
     
-    await db.execute("DELETE FROM bot_reviews WHERE id = $1", id)
-    for review in check["replies"]:
-        await db.execute("DELETE FROM bot_reviews WHERE id = $1", review)
+            await conn.execute("DELETE FROM bot_reviews WHERE id = $1", id)
+            await conn.execute("DELETE FROM bot_reviews WHERE id = ANY($1::uuid[]) AND reply = true", check["replies"])
+            if not check["reply"]:
+                await review_stats_update(conn, bot_id, remove = check["star_rating"])
         
     await bot_add_event(
         bot_id, 
@@ -194,12 +202,8 @@ async def delete_review(request: Request, user_id: int, bot_id: int, id: uuid.UU
         }
     )
 
-    # Recache reviews
-    await parse_reviews(
-        request.app.state.worker_session, 
-        bot_id, 
-        recache = True
-    )
+    # Remove the review and its replies from the cache
+    await review_cache_delete(request.app.state.worker_session, bot_id, id, *check["replies"])
 
     return api_success()    
 
@@ -234,5 +238,6 @@ async def vote_review_api(request: Request, user_id: int, bot_id: int, rid: uuid
                 break
     bot_rev[main_key].append(user_id)
     await db.execute("UPDATE bot_reviews SET review_upvotes = $1, review_downvotes = $2 WHERE id = $3", bot_rev["review_upvotes"], bot_rev["review_downvotes"], rid)
+    await review_cache_update(request.app.state.worker_session, bot_id, rid)
     await bot_add_event(bot_id, enums.APIEvents.review_vote, {"user": str(user_id), "id": str(rid), "star_rating": bot_rev["star_rating"], "reply": bot_rev["reply"], "review": bot_rev["review_text"], "upvotes": len(bot_rev["review_upvotes"]), "downvotes": len(bot_rev["review_downvotes"]), "upvote": vote.upvote})
     return api_success()
@@ -11,6 +11,8 @@ class BotListStats(BaseModel):
     bot_count: int
     bot_count_total: int
     workers: Optional[List[int]] = []
+    ipc: Optional[dict] = None
+    user_cache: Optional[dict] = None
 
 class PartialBotQueue(BaseModel):
     user: Optional[BaseUser] = BaseUser()
@@ -23,3 +25,4 @@ class BotQueueList(BaseModel):
 
 class BotQueueGet(BaseModel):
     bots: Optional[BotQueueList] = None
+    cursor: Optional[str] = None # Cursor of the next page
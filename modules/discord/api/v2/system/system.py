@@ -1,6 +1,8 @@
 from typing import Optional
 
 from modules.core import *
+from modules.core.cache import user_l1
+from modules.core.ipc import ipc_stats
 
 from ..base import API_VERSION
 from .models import BotListStats, BotQueueGet
@@ -29,6 +31,8 @@ async def get_botlist_stats(
         bot_count_total - The bot count of the list
         bot_count - The approved and certified bots on the list
         workers - The worker pids
+        ipc - IPC counters for the given worker (calls, in flight calls, timeouts and a latency histogram in seconds)
+        user_cache - Stats of the in-process user cache of the given worker (hits, misses, evictions etc.)
     """
     up = worker_session.up
     db = worker_session.postgres
@@ -45,7 +49,9 @@ async def get_botlist_stats(
         "dup": True,
         "bot_count": bot_count, 
         "bot_count_total": bot_count_total,
-        "workers": worker_session.workers
+        "workers": worker_session.workers,
+        "ipc": ipc_stats.dict(),
+        "user_cache": user_l1.stats()
     }
 
 @router.get("/features")
@@ -76,14 +82,33 @@ async def get_bot_queue(
     request: Request, 
     state: enums.BotState = enums.BotState.pending, 
     verifier: int = None, 
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    stream: bool = False,
     worker_session = Depends(worker_session)
 ):
-    """Admin API to get the bot queue"""
+    """
+    Admin API to get the bot queue (oldest first). 
+    Pass the returned cursor as after to get the next page, cursor is null on the last page. 
+    With stream (or Accept: application/x-ndjson), all bots after the cursor are streamed as NDJSON (one bot per line) instead
+    """
     db = worker_session.postgres
-    if verifier:
-        bots = await db.fetch("SELECT bot_id, prefix, description FROM bots WHERE state = $1 AND verifier = $2 ORDER BY created_at ASC", state, verifier)
-    bots = await db.fetch("SELECT bot_id, prefix, description FROM bots WHERE state = $1 ORDER BY created_at ASC", state)
-    return {"bots": [{"user": await get_bot(bot["bot_id"]), "prefix": bot["prefix"], "invite": await invite_bot(bot["bot_id"], api = True), "description": bot["description"]} for bot in bots]}
+    key = bot_cursor_key(after)
+    if key is None:
+        return api_error("Invalid cursor")
+
+    async def _hydrate(bots):
+        users = await get_bots_many([bot["bot_id"] for bot in bots], worker_session = worker_session)
+        return [{"user": user, "prefix": bot["prefix"], "invite": await invite_bot(bot["bot_id"], api = True), "description": bot["description"]} for bot, user in zip(bots, users)]
+
+    query = """SELECT bot_id, prefix, description, created_at FROM bots WHERE state = $1 AND ($2::bigint IS NULL OR verifier = $2) 
+    AND ($3::timestamptz IS NULL OR (created_at, bot_id) > ($3::timestamptz, $4::bigint)) ORDER BY created_at, bot_id LIMIT $5"""
+    if wants_ndjson(request, stream):
+        return ndjson_response(stream_query(worker_session, query, state, verifier, key = bot_key, after = key, hydrate = _hydrate))
+
+    bots = await db.fetch(query, state, verifier, *key, limit + 1)
+    cursor = bot_cursor(bots[limit - 1]) if len(bots) > limit else None
+    return {"bots": await _hydrate(bots[:limit]), "cursor": cursor}
 
 @router.get(
     "/staff_roles",
@@ -20,26 +20,36 @@ async def get_list(request: Request, url: str):
     return lst
 
 @router.get("/lists")
-async def get_all_lists(request: Request):
-    lists = await db.fetch("SELECT icon, url, api_url, api_docs, discord, description, supported_features, owners FROM bot_list WHERE state = $1", enums.ULAState.approved)
+async def get_all_lists(request: Request, stream: bool = False):
+    """With stream (or Accept: application/x-ndjson), lists are streamed as NDJSON (one list per line)"""
+    worker_session = request.app.state.worker_session
+    query = "SELECT icon, url, api_url, api_docs, discord, description, supported_features, owners FROM bot_list WHERE state = $1 AND ($2::text IS NULL OR url > $2) ORDER BY url LIMIT $3"
+
+    async def _hydrate(lists):
+        # Fetch the endpoints of all lists in the chunk at once
+        apis = {}
+        for api_ep in await db.fetch(
+            "SELECT url, method, feature AS api_type, supported_fields, api_path FROM bot_list_api WHERE url = ANY($1::text[])", 
+            [l["url"] for l in lists]
+        ):
+            api_ep = dict(api_ep)
+            api_ep["supported_fields"] = orjson.loads(api_ep["supported_fields"]) or {}
+            apis.setdefault(api_ep.pop("url"), []).append(api_ep)
+
+        ret = []
+        for l in lists:
+            l = dict(l)
+            l["api_docs"] = l["api_docs"] or None # Make sure "" = None
+            ret.append({l["url"]: {"list": l, "api": apis.get(l["url"], [])}})
+        return ret
+
+    if wants_ndjson(request, stream):
+        return ndjson_response(stream_query(worker_session, query, enums.ULAState.approved, key = lambda l: (l["url"],), after = (None,), hydrate = _hydrate))
+
+    lists = await db.fetch(query, enums.ULAState.approved, None, None)
     if not lists:
         return api_error("No lists found")
-    lists = dict({"lists": lists})
-    ret = {"lists": []}
-    for l in lists["lists"]:
-        l = dict(l)
-        if l["api_docs"]:
-            pass
-        else:
-            l["api_docs"] = None # Make sure "" = None
-        api = await db.fetch("SELECT method, feature AS api_type, supported_fields, api_path FROM bot_list_api WHERE url = $1", l["url"])
-        api = [dict(obj) for obj in api]
-        for api_ep in api:
-            api_ep["supported_fields"] = orjson.loads(api_ep["supported_fields"])
-            if not api_ep["supported_fields"]:
-                api_ep["supported_fields"] = {}
-        ret["lists"].append({l["url"]: {"list": l, "api": api}})
-    return ret
+    return {"lists": await _hydrate(lists)}
 
 async def list_check(blist: BList, user_id: Optional[int] = None):
     if blist.url.startswith("https://") or blist.api_url.startswith("https://"):
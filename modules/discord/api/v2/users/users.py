@@ -19,7 +19,7 @@ router = APIRouter(
     operation_id="fetch_user"
 )
 async def fetch_user(request: Request, user_id: int, worker_session = Depends(worker_session)):
-    user = await _User(id = user_id, db = worker_session.postgres).profile()
+    user = await _User(id = user_id, db = worker_session.postgres).profile(worker_session = worker_session)
     if not user:
         return abort(404)
     return user
@@ -48,6 +48,8 @@ async def regenerate_user_token(request: Request, user_id: int):
     ** User API Token**: You can get this by clicking your profile and scrolling to the bottom and you will see your API Token
     """
     await db.execute("UPDATE users SET api_token = $1 WHERE user_id = $2", get_token(132), user_id)
+    await token_cache_invalidate(redis_db, "user", user_id)
+    await user_context_invalidate(redis_db, user_id)
     return api_success()
 
 @router.patch(
@@ -57,7 +59,8 @@ async def regenerate_user_token(request: Request, user_id: int):
     ]
 )
 async def set_js_mode(request: Request, user_id: int, data: UserJSPatch):
-    await db.execute("UPDATE users SET js_allowed = $1", data.js_allowed)
+    await db.execute("UPDATE users SET js_allowed = $1 WHERE user_id = $2", data.js_allowed, user_id)
+    await user_context_invalidate(redis_db, user_id)
     request.session["js_allowed"] = data.js_allowed
     return api_success()
 
@@ -153,8 +156,12 @@ async def delete_bot(request: Request, user_id: int, bot_id: int):
         return api_error(
             f"This bot cannot be deleted as it has been locked with a code of {int(lock)}: ({lock.__doc__}). If this bot is not staff locked, join the support server and run +unlock <BOT> to unlock it."
         )
+    owners = await db.fetch("SELECT owner FROM bot_owner WHERE bot_id = $1", bot_id)
     await db.execute(f"DELETE FROM bots WHERE bot_id = $1", bot_id)
+    await token_cache_invalidate(redis_db, "bot", bot_id)
+    await bot_page_invalidate(redis_db, bot_id)
     await db.execute("DELETE FROM vanity WHERE redirect = $1", bot_id)
+    await profile_search_index(db, redis_db, [owner["owner"] for owner in owners])
 
     # Check all packs
     packs = await db.fetch("SELECT bots FROM bot_packs")
@@ -169,6 +176,7 @@ async def delete_bot(request: Request, user_id: int, bot_id: int):
     await redis_ipc_new(redis_db, "SENDMSG", msg=msg, timeout=None)
 
     await bot_add_event(bot_id, enums.APIEvents.bot_delete, {"user": user_id})    
+    await request_index_refresh(redis_db, "delete")
     return api_success(status_code = 202)
 
 @router.patch(
@@ -222,6 +230,9 @@ async def transfer_bot_ownership(request: Request, user_id: int, bot_id: int, tr
             await conn.execute("UPDATE bot_owner SET main = false WHERE main = true AND bot_id = $1", bot_id)
             await conn.execute("INSERT INTO bot_owner (bot_id, owner, main) VALUES ($1, $2, $3)", bot_id, transfer.new_owner, True)
     
+    owners = await db.fetch("SELECT owner FROM bot_owner WHERE bot_id = $1", bot_id)
+    await profile_search_index(db, redis_db, [owner["owner"] for owner in owners])
+
     embed = discord.Embed(title="Bot Ownership Transfer", description=f"<@{user_id}> has transferred ownership of bot <@{bot_id}> to <@{transfer.new_owner}>!", color=discord.Color.green())
     msg = {"content": "", "embed": embed.to_dict(), "channel_id": str(bot_logs), "mention_roles": []}
     await redis_ipc_new(redis_db, "SENDMSG", msg=msg, timeout=None)
@@ -16,6 +16,7 @@ class BotVoteCheck(BaseModel):
     vote_epoch: Optional[int] = None
     time_to_vote: Optional[int] = None
     vts: Optional[list] = None
+    vts_cursor: Optional[str] = None
     type: str
     reason: Optional[str] = None
     partial: bool
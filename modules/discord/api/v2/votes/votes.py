@@ -23,23 +23,38 @@ router = APIRouter(
         Depends(bot_user_auth_check)
     ]
 )
-async def get_user_votes(request: Request, bot_id: int, user_id: int):
-    """Endpoint to check amount of votes a user has."""
-    voter_ts = await db.fetchval(
-        "SELECT timestamps FROM bot_voters WHERE bot_id = $1 AND user_id = $2", 
+async def get_user_votes(
+    request: Request, 
+    bot_id: int, 
+    user_id: int, 
+    vts_limit: int = Query(10, ge=0, le=100), 
+    vts_before: Optional[str] = None
+):
+    """
+    Endpoint to check amount of votes a user has. 
+
+    vts is a page of vote timestamps, newest first. Pass vts_cursor as vts_before to get the next page
+    """
+    voter = await get_voter(
+        db, 
         bot_id, 
-        user_id
+        user_id, 
+        vts_limit = vts_limit, 
+        vts_before = vts_before
     )
+    if voter is None:
+        return api_error("Invalid cursor")
     
     vote_epoch = await redis_db.ttl(f"vote_lock:{user_id}")
 
-    voter_count = len(voter_ts) if voter_ts else 0
+    voter_count = voter["votes"]
     
     return {
         "votes": voter_count, 
         "voted": voter_count != 0, 
         "vote_epoch": vote_epoch, 
-        "vts": voter_ts, 
+        "vts": voter["vts"], 
+        "vts_cursor": voter["cursor"], 
         "time_to_vote": 60*60*8 - vote_epoch if vote_epoch else 0, 
         "vote_right_now": vote_epoch == -2, 
         "type": "Vote", 
@@ -46,17 +46,14 @@ async def bot_settings(request: Request, bot_id: int):
     if not owners:
         return "This bot has no found owners.\nPlease contact Fates List support"
     
-    owners_lst = [
-        (await get_user(obj["owner"], user_only = True, worker_session = worker_session))
-        for obj in owners if obj["owner"] is not None and obj["main"]
-    ]
-
-    owners_lst_extra = [
-        (await get_user(obj["owner"], user_only = True, worker_session = worker_session))
-        for obj in owners if obj["owner"] is not None and not obj["main"]
-    ]
+    owners_lst = await get_users_many(
+        [obj["owner"] for obj in owners if obj["owner"] is not None and obj["main"]] 
+        + [obj["owner"] for obj in owners if obj["owner"] is not None and not obj["main"]],
+        user_only = True, 
+        worker_session = worker_session
+    )
     
-    owners_html = gen_owner_html(owners_lst + owners_lst_extra)   
+    owners_html = gen_owner_html(owners_lst)   
         
     bot["extra_owners"] = ",".join([str(o["owner"]) for o in owners if not o["main"]])
     bot["user"] = await get_bot(bot_id, worker_session = worker_session)
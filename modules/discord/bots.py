@@ -44,6 +44,7 @@ async def bot_review_page(request: Request, bot_id: int, page: int = 1):
         "review_page": page, 
         "total_review_pages": reviews[3], 
         "per_page": reviews[4],
+        "star_histogram": reviews[5]["stars"],
     }
 
     bot_info = await get_bot(bot_id, worker_session = request.app.state.worker_session)
@@ -71,23 +71,60 @@ async def features_view(request: Request, name: str):
 
 
 @router.get("/fates/stats")
-async def stats_page(request: Request, full: bool = False):
+async def stats_page(
+    request: Request, 
+    full: bool = False, 
+    queue_after: Optional[str] = None, 
+    denied_after: Optional[str] = None, 
+    banned_after: Optional[str] = None, 
+    limit: int = Query(100, ge=1, le=500),
+    stream: bool = False
+):
+    """
+    Queue, denied and banned bots are paginated (oldest first) using the cursors returned with them.
+    With stream (or Accept: application/x-ndjson), the amounts and then all bots of every section are streamed as NDJSON
+    """
     worker_session = request.app.state.worker_session
+    db = worker_session.postgres
+    amounts = dict(await db.fetch("SELECT state, COUNT(1) FROM bots GROUP BY state"))
+    amounts = {
+        "bot_amount": amounts.get(enums.BotState.approved, 0) + amounts.get(enums.BotState.certified, 0),
+        "queue_amt": amounts.get(enums.BotState.pending, 0),
+        "denied_amt": amounts.get(enums.BotState.denied, 0),
+        "banned_amt": amounts.get(enums.BotState.banned, 0),
+    }
+    if wants_ndjson(request, stream):
+        states = {
+            "certified": enums.BotState.certified, 
+            "queue": enums.BotState.pending, 
+            "under_review": enums.BotState.under_review
+        }
+        if full:
+            states |= {"denied": enums.BotState.denied, "banned": enums.BotState.banned}
+
+        async def _amounts():
+            yield [{"type": "amounts", "data": amounts}]
+
+        def _section(section: str, state: enums.BotState):
+            async def _hydrate(rows):
+                return [{"type": section, "data": bot} for bot in await parse_index_query(worker_session, rows)]
+            return stream_query(worker_session, keyset_query, [int(state)], key = bot_key, after = (None, None), hydrate = _hydrate)
+
+        return ndjson_response(_amounts(), *[_section(section, state) for section, state in states.items()])
+
     certified = await do_index_query(state = [enums.BotState.certified], limit = None, worker_session = worker_session) 
-    bot_amount = await db.fetchval("SELECT COUNT(1) FROM bots WHERE state = 0 OR state = 6")
-    queue = await do_index_query(state = [enums.BotState.pending], limit = None, add_query = "ORDER BY created_at ASC", worker_session = worker_session)
-    under_review = await do_index_query(state = [enums.BotState.under_review], limit = None, add_query = "ORDER BY created_at ASC", worker_session = worker_session)
+    sections = {"queue": (enums.BotState.pending, queue_after)}
     if full:
-        denied = await do_index_query(state = [enums.BotState.denied], limit = None, add_query = "ORDER BY created_at ASC", worker_session = worker_session)
-        banned = await do_index_query(state = [enums.BotState.banned], limit = None, add_query = "ORDER BY created_at ASC", worker_session = worker_session)
-    data = {
+        sections |= {"denied": (enums.BotState.denied, denied_after), "banned": (enums.BotState.banned, banned_after)}
+    data = {"denied": [], "banned": []}
+    for section, (state, after) in sections.items():
+        page = await do_keyset_query(worker_session, [state], after = after, limit = limit)
+        if page is None:
+            return abort(400)
+        data[section], data[f"{section}_cursor"] = page
+    under_review = await do_index_query(state = [enums.BotState.under_review], limit = None, add_query = "ORDER BY created_at ASC", worker_session = worker_session)
+    data |= amounts | {
         "certified": certified,
-        "bot_amount": bot_amount,
-        "queue": queue,
-        "denied": denied if full else [],
-        "denied_amt": await db.fetchval("SELECT COUNT(1) FROM bots WHERE state = $1", enums.BotState.denied),
-        "banned": banned if full else [],
-        "banned_amt": await db.fetchval("SELECT COUNT(1) FROM bots WHERE state = $1", enums.BotState.banned),
         "under_review": under_review,
         "full": full
     }
@@ -37,7 +37,7 @@ async def get_user_profile(request, user_id: int, preview: bool, worker_session)
     user = await core.User(
         id = user_id, 
         db = db, 
-    ).profile()
+    ).profile(worker_session = worker_session)
 
     if not user:
         return await templates.e(request, "Profile Not Found", 404)
@@ -7,8 +7,8 @@ router = APIRouter(
 )
 
 @router.get("/t")
-async def search(request: Request, q: str):
-    return await render_search(request = request, q = q, api = False)
+async def search(request: Request, q: str, page: int = 1):
+    return await render_search(request = request, q = q, api = False, page = page)
 
 @router.get("/tags")
 async def tags(request: Request, tag: str):
@@ -151,6 +151,11 @@ func AdminOp(
 			}
 		}
 
+		if op_err == "" {
+			// Bot state changed, ask the primary worker to refresh the index snapshot
+			rdb.Publish(ctx, "_worker_fates", "INDEXREFRESH admin")
+		}
+
 		if op_err != "" {
 			op_err += "\nCurrent State: " + state_data.Str() + "\nBot owner: " + strconv.FormatInt(owner.Int, 10)
 		} else {
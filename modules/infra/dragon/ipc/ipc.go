@@ -20,6 +20,7 @@ import (
 
 const (
 	workerChannel     string        = "_worker_fates"
+	replyChannel      string        = "_worker_fates_reply-"
 	commandExpiryTime time.Duration = 30 * time.Second
 	ipcVersion        string        = "3"
 )
@@ -366,6 +367,11 @@ func StartIPC(dbpool *pgxpool.Pool, discord *discordgo.Session, rdb *redis.Clien
 
 			res := val.Handler(op, ipcContext)
 			rdb.Set(ctx, cmd_id, res, commandExpiryTime)
+
+			// Command ids of the form <UUID>@<PID> also get the reply published on the workers reply channel
+			if sep := strings.LastIndex(cmd_id, "@"); sep != -1 {
+				rdb.Publish(ctx, replyChannel+cmd_id[sep+1:], cmd_id+" "+res)
+			}
 		}
 	}
 
@@ -212,9 +212,11 @@ func msgPump(c *Client) {
 		if !c.SendAll {
 			return
 		}
-		msgs := c.hub.redis.HGet(ctx, channelName, "ws").Val()
-		if msgs != "" {
-			sendMessages(c, []byte(msgs))
+		msgs := c.hub.redis.XRange(ctx, channelName+"-ws", "-", "+").Val()
+		for _, msg := range msgs {
+			if event, ok := msg.Values["ws"].(string); ok {
+				sendMessages(c, []byte(event))
+			}
 		}
 		time.Sleep(1 * time.Second)
 		go sendWsData(c, "done_prior", "Done sending all prior messages")